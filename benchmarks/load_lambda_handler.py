@@ -0,0 +1,403 @@
+"""Replays mixed GraphQL workloads as API Gateway events against the Lambda handler
+
+Every worker thread runs user sessions: a session either queries the statistics or browses the properties of a
+viewport around the configured center, following up to a given number of pages. Requests go through
+main.lambda_handler against the MongoDB instance given by MONGODB_URI, so the whole hot path is exercised.
+
+Example:
+
+    $ MONGODB_URI=mongodb://localhost:27017 python benchmarks/load_lambda_handler.py --seed 50000 --threads 16
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, AnyStr, Dict, List, Optional
+
+import pymongo
+import pymongo.monitoring
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_DIRECTORY = os.path.join(ROOT_DIRECTORY, 'fetch_properties')
+EVENT_FIXTURE = os.path.join(ROOT_DIRECTORY, 'tests', 'resources', 'event-api-gateway.json')
+
+DEFAULT_CENTER = (45.0703, 7.6869)
+CONDITIONS = ['BEST', 'GOOD', 'TO_RENOVATE']
+
+PROPERTIES_QUERY = '''{
+  propertiesByBoundingBoxAndFilter(
+    boundingBox: {
+      bottomLeft: {latitude: %(min_latitude)f, longitude: %(min_longitude)f},
+      topRight: {latitude: %(max_latitude)f, longitude: %(max_longitude)f}
+    },
+    filter: {nRooms: {min: %(n_rooms_min)d, max: %(n_rooms_max)d}, condition: "%(condition)s"},
+    page: "%(page)s"
+  ) {
+    properties { id price location { latitude longitude geohash } }
+    page
+  }
+}'''
+
+STATISTICS_QUERY = '''{
+  statisticsByFilter(
+    filter: {nRooms: {min: %(n_rooms_min)d, max: %(n_rooms_max)d}, condition: "%(condition)s"}
+  ) {
+    localStatistics { geohash price { min max avg median } score }
+    globalStatistics { price { min max avg median } }
+  }
+}'''
+
+
+class PoolMonitor(pymongo.monitoring.ConnectionPoolListener):
+    """Tracks connection pool saturation: concurrent checkouts, checkout wait times and failures"""
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.connections_created = 0
+        self.wait_times = []
+
+    def connection_check_out_started(self, event):
+
+        self.local.started_at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+
+        wait_time = time.perf_counter() - getattr(self.local, 'started_at', time.perf_counter())
+        with self.lock:
+            self.checked_out += 1
+            self.checkouts += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.wait_times.append(wait_time)
+
+    def connection_checked_in(self, event):
+
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+
+        with self.lock:
+            self.checkout_failures += 1
+
+    def connection_created(self, event):
+
+        with self.lock:
+            self.connections_created += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def to_dict(self) -> Dict[AnyStr, Any]:
+
+        return dict(
+            max_checked_out=self.max_checked_out,
+            checkouts=self.checkouts,
+            checkout_failures=self.checkout_failures,
+            connections_created=self.connections_created,
+            wait_times=self.wait_times
+        )
+
+
+@dataclass
+class Workload:
+
+    statistics_ratio: float
+    max_paging_depth: int
+    viewport_sizes: List[float]
+    center: tuple = DEFAULT_CENTER
+    spread: float = 0.2
+
+    def sessions(self, randomizer: random.Random):
+        """Generates user sessions forever, each one being a kind and its query parameters"""
+
+        while True:
+            n_rooms_min = randomizer.randint(1, 3)
+            parameters = dict(
+                n_rooms_min=n_rooms_min,
+                n_rooms_max=n_rooms_min + randomizer.randint(0, 3),
+                condition=randomizer.choice(CONDITIONS),
+                page=''
+            )
+            if randomizer.random() < self.statistics_ratio:
+                yield 'statistics', parameters, 0
+                continue
+
+            viewport_size = randomizer.choice(self.viewport_sizes)
+            latitude = self.center[0] + randomizer.uniform(-self.spread, self.spread)
+            longitude = self.center[1] + randomizer.uniform(-self.spread, self.spread)
+            parameters.update(
+                min_latitude=latitude - viewport_size / 2,
+                min_longitude=longitude - viewport_size / 2,
+                max_latitude=latitude + viewport_size / 2,
+                max_longitude=longitude + viewport_size / 2
+            )
+            yield 'properties', parameters, randomizer.randint(0, self.max_paging_depth)
+
+
+@dataclass
+class Results:
+
+    latencies: Dict[AnyStr, List[float]] = field(default_factory=dict)
+    errors: int = 0
+    requests: int = 0
+
+    def add(self, kind: AnyStr, latency: float, failed: bool):
+
+        self.latencies.setdefault(kind, []).append(latency)
+        self.requests += 1
+        self.errors += 1 if failed else 0
+
+    def merge(self, other: 'Results'):
+
+        for kind, latencies in other.latencies.items():
+            self.latencies.setdefault(kind, []).extend(latencies)
+        self.requests += other.requests
+        self.errors += other.errors
+
+
+def build_event(event_template: Dict[AnyStr, Any], query: AnyStr) -> Dict[AnyStr, Any]:
+
+    event = copy.deepcopy(event_template)
+    event['queryStringParameters'] = dict(query=query)
+
+    return event
+
+
+def seed_collection(count: int, center: tuple, spread: float, randomizer: random.Random):
+    """Inserts synthetic listings around the center, with the indexes the queries rely on"""
+
+    import bson
+    import pygeohash
+
+    from core.mongodb import MONGODB_CONNECTION
+
+    client = pymongo.MongoClient(MONGODB_CONNECTION.uri)
+    collection = client[MONGODB_CONNECTION.database][MONGODB_CONNECTION.collection]
+
+    documents = []
+    for index in range(count):
+        latitude = center[0] + randomizer.uniform(-spread, spread)
+        longitude = center[1] + randomizer.uniform(-spread, spread)
+        documents.append(dict(
+            price=randomizer.randint(40_000, 1_500_000),
+            n_rooms=randomizer.randint(1, 7),
+            surface=randomizer.randint(25, 300),
+            condition=randomizer.choice(CONDITIONS),
+            published_on=f'2021-{randomizer.randint(1, 12):02d}-{randomizer.randint(1, 28):02d}',
+            location=dict(
+                point=dict(type='Point', coordinates=[longitude, latitude]),
+                geohash=pygeohash.encode(latitude=latitude, longitude=longitude, precision=9)
+            ),
+            cursor=bson.ObjectId()
+        ))
+        if len(documents) == 10_000 or index == count - 1:
+            collection.insert_many(documents)
+            documents = []
+
+    collection.create_index([('location.point', pymongo.GEOSPHERE)])
+    collection.create_index([('condition', pymongo.ASCENDING), ('published_on', pymongo.DESCENDING),
+                             ('n_rooms', pymongo.ASCENDING), ('surface', pymongo.ASCENDING)])
+    client.close()
+
+
+def run_worker(handler: Any, event_template: Dict[AnyStr, Any], workload: Workload,
+               deadline: float, seed: int) -> Results:
+
+    randomizer = random.Random(seed)
+    results = Results()
+
+    for kind, parameters, paging_depth in workload.sessions(randomizer=randomizer):
+        for page_index in range(paging_depth + 1):
+            if time.perf_counter() >= deadline:
+                return results
+
+            query = (STATISTICS_QUERY if kind == 'statistics' else PROPERTIES_QUERY) % parameters
+            started_at = time.perf_counter()
+            try:
+                response = handler(build_event(event_template=event_template, query=query), None)
+                body = json.loads(response['body'])
+                failed = response.get('statusCode') != 200 or body.get('errors') is not None
+            except Exception:
+                body = {}
+                failed = True
+            results.add(kind=f'{kind}[{page_index}]' if kind == 'properties' else kind,
+                        latency=time.perf_counter() - started_at, failed=failed)
+
+            page = ((body.get('data') or {}).get('propertiesByBoundingBoxAndFilter') or {}).get('page')
+            if kind != 'properties' or failed or not page:
+                break
+            parameters = dict(parameters, page=page)
+
+    return results
+
+
+def run_process(threads: int, duration: float, workload: Workload, seed: int,
+                pool_monitor: Optional[PoolMonitor] = None) -> Dict[AnyStr, Any]:
+    """Runs the worker threads of a process and returns its results and pool statistics
+
+    The pool monitor has to be registered before the handler module creates its MongoDB client.
+    """
+
+    if pool_monitor is None:
+        pool_monitor = PoolMonitor()
+        pymongo.monitoring.register(pool_monitor)
+
+    if PACKAGE_DIRECTORY not in sys.path:
+        sys.path.insert(0, PACKAGE_DIRECTORY)
+    import main
+    from core.schema.resolver import SINGLE_FLIGHT
+
+    with open(EVENT_FIXTURE, 'r') as file:
+        event_template = json.load(file)
+
+    deadline = time.perf_counter() + duration
+    results = Results()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = [
+            executor.submit(run_worker, main.lambda_handler, event_template, workload, deadline, seed * 1_000 + thread)
+            for thread in range(threads)
+        ]
+        for future in futures:
+            results.merge(future.result())
+
+    single_flight = dict(executed=SINGLE_FLIGHT.executed, coalesced=SINGLE_FLIGHT.coalesced) \
+        if SINGLE_FLIGHT is not None else None
+
+    return dict(results=results, pool=pool_monitor.to_dict(), single_flight=single_flight)
+
+
+def percentile(values: List[float], rank: float) -> Optional[float]:
+
+    if len(values) == 0:
+        return None
+
+    ordered = sorted(values)
+
+    return ordered[min(int(rank * len(ordered)), len(ordered) - 1)]
+
+
+def report(results: Results, pools: List[Dict[AnyStr, Any]], single_flights: List[Optional[Dict[AnyStr, int]]],
+           duration: float, threads: int):
+
+    print(f'Requests: {results.requests} in {duration:.1f}s, {results.requests / duration:.1f} req/s, '
+          f'{results.errors} errors')
+    print(f'{"operation":<16}{"count":>8}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+    for kind in sorted(results.latencies):
+        latencies = results.latencies[kind]
+        print(f'{kind:<16}{len(latencies):>8}' + ''.join(
+            f'{percentile(latencies, rank) * 1_000:>10.1f}' for rank in (0.5, 0.9, 0.99, 1.0)
+        ))
+
+    wait_times = [wait_time for pool in pools for wait_time in pool['wait_times']]
+    print(f'Connection pool: max checked out per process {max(pool["max_checked_out"] for pool in pools)} '
+          f'with {threads} threads, {sum(pool["connections_created"] for pool in pools)} connections created, '
+          f'{sum(pool["checkouts"] for pool in pools)} checkouts, '
+          f'{sum(pool["checkout_failures"] for pool in pools)} checkout failures')
+    if len(wait_times) > 0:
+        print(f'Checkout wait: p50 {percentile(wait_times, 0.5) * 1_000:.2f} ms, '
+              f'p99 {percentile(wait_times, 0.99) * 1_000:.2f} ms, max {max(wait_times) * 1_000:.2f} ms')
+
+    single_flights = [single_flight for single_flight in single_flights if single_flight is not None]
+    if len(single_flights) > 0:
+        print(f'Single flight: {sum(single_flight["executed"] for single_flight in single_flights)} resolver calls '
+              f'executed, {sum(single_flight["coalesced"] for single_flight in single_flights)} coalesced')
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description='Load tests the Lambda handler against a local MongoDB')
+    parser.add_argument('--threads', type=int, default=8, help='Worker threads per process')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=30.0, help='Duration in seconds')
+    parser.add_argument('--statistics-ratio', type=float, default=0.2)
+    parser.add_argument('--max-paging-depth', type=int, default=3)
+    parser.add_argument('--viewport-sizes', default='0.01,0.05,0.2', help='Viewport sizes in degrees')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic listings inserted before the run')
+    parser.add_argument('--random-seed', type=int, default=42)
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '100')
+
+    workload = Workload(
+        statistics_ratio=arguments.statistics_ratio,
+        max_paging_depth=arguments.max_paging_depth,
+        viewport_sizes=[float(size) for size in arguments.viewport_sizes.split(',')]
+    )
+
+    pool_monitor = None
+    if arguments.processes < 2:
+        pool_monitor = PoolMonitor()
+        pymongo.monitoring.register(pool_monitor)
+
+    if arguments.seed > 0:
+        if PACKAGE_DIRECTORY not in sys.path:
+            sys.path.insert(0, PACKAGE_DIRECTORY)
+        seed_collection(count=arguments.seed, center=workload.center, spread=workload.spread,
+                        randomizer=random.Random(arguments.random_seed))
+        if pool_monitor is not None:
+            pool_monitor.reset()
+
+    started_at = time.perf_counter()
+    if arguments.processes > 1:
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes=arguments.processes) as pool:
+            outcomes = pool.starmap(run_process, [
+                (arguments.threads, arguments.duration, workload, arguments.random_seed + process)
+                for process in range(arguments.processes)
+            ])
+    else:
+        outcomes = [run_process(arguments.threads, arguments.duration, workload, arguments.random_seed,
+                                pool_monitor=pool_monitor)]
+    duration = time.perf_counter() - started_at
+
+    results = Results()
+    for outcome in outcomes:
+        results.merge(outcome['results'])
+
+    report(results=results, pools=[outcome['pool'] for outcome in outcomes],
+           single_flights=[outcome['single_flight'] for outcome in outcomes], duration=duration,
+           threads=arguments.threads)
+
+
+if __name__ == '__main__':
+    main()
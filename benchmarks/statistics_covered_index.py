@@ -0,0 +1,156 @@
+"""Compares the documents examined by the local statistics aggregation before and after the geohash prefix migration
+
+Before: the geohash cell is computed with $substr on every listing, which has to be fetched.
+After: the cell is read from the precomputed prefix field and the statistics index covers the aggregation.
+
+Example:
+
+    $ MONGODB_URI=mongodb://localhost:27017 python benchmarks/statistics_covered_index.py --count 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+from typing import Any, AnyStr, Dict, Optional
+
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENTER = (45.0703, 7.6869)
+SPREAD = 0.2
+CONDITIONS = ['BEST', 'GOOD', 'TO_RENOVATE']
+
+
+def seed_collection(collection: Any, count: int, randomizer: random.Random):
+
+    import bson
+    import pygeohash
+
+    documents = []
+    for index in range(count):
+        latitude = CENTER[0] + randomizer.uniform(-SPREAD, SPREAD)
+        longitude = CENTER[1] + randomizer.uniform(-SPREAD, SPREAD)
+        documents.append(dict(
+            price=randomizer.randint(40_000, 1_500_000),
+            n_rooms=randomizer.randint(1, 7),
+            surface=randomizer.randint(25, 300),
+            condition=randomizer.choice(CONDITIONS),
+            published_on=f'2021-{randomizer.randint(1, 12):02d}-{randomizer.randint(1, 28):02d}',
+            location=dict(
+                point=dict(type='Point', coordinates=[longitude, latitude]),
+                geohash=pygeohash.encode(latitude=latitude, longitude=longitude, precision=9)
+            ),
+            cursor=bson.ObjectId()
+        ))
+        if len(documents) == 10_000 or index == count - 1:
+            collection.insert_many(documents)
+            documents = []
+
+
+def find_statistic(explanation: Any, name: AnyStr) -> Optional[int]:
+    """Finds the first occurrence of an execution statistic in an explain output, whatever the pipeline shape"""
+
+    if isinstance(explanation, dict):
+        if name in explanation:
+            return explanation[name]
+        values = explanation.values()
+    elif isinstance(explanation, list):
+        values = explanation
+    else:
+        return None
+
+    for value in values:
+        statistic = find_statistic(value, name)
+        if statistic is not None:
+            return statistic
+
+    return None
+
+
+def explain_statistics(resolver: Any, filter: Any) -> Dict[AnyStr, Any]:
+
+    from core.schema.resolver import PRICE_STATISTICS
+
+    database = resolver.mongodb_client[resolver.mongodb_connection.database]
+    pipeline, query_plan = resolver.get_statistics_pipeline(
+        filter=filter, statistics=set(PRICE_STATISTICS), by_geohash=True
+    )
+
+    started_at = time.perf_counter()
+    explanation = database.command(
+        'explain',
+        {'aggregate': resolver.mongodb_connection.collection, 'pipeline': pipeline, 'cursor': {}, **query_plan.options},
+        verbosity='executionStats'
+    )
+    elapsed = time.perf_counter() - started_at
+
+    return dict(
+        hint=query_plan.hint,
+        docs_examined=find_statistic(explanation, 'totalDocsExamined'),
+        keys_examined=find_statistic(explanation, 'totalKeysExamined'),
+        elapsed_ms=elapsed * 1_000
+    )
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmarks the covered statistics index')
+    parser.add_argument('--count', type=int, default=100_000)
+    parser.add_argument('--collection', default='properties_benchmark')
+    parser.add_argument('--random-seed', type=int, default=42)
+    arguments = parser.parse_args()
+
+    os.environ.setdefault('MONGODB_URI', 'mongodb://localhost:27017')
+    os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '100')
+    sys.path.insert(0, os.path.join(ROOT_DIRECTORY, 'fetch_properties'))
+
+    import pymongo
+
+    from core.mongodb import MongoDBConnection, MONGODB_CONNECTION
+    from core.mongodb.migration import migrate
+    from core.schema.resolver import MongoDBResolver, MAX_PAGE_SIZE
+
+    client = pymongo.MongoClient(MONGODB_CONNECTION.uri)
+    connection = MongoDBConnection(
+        uri=MONGODB_CONNECTION.uri,
+        database=MONGODB_CONNECTION.database,
+        collection=arguments.collection
+    )
+    collection = client[connection.database][connection.collection]
+    collection.drop()
+
+    seed_collection(collection=collection, count=arguments.count, randomizer=random.Random(arguments.random_seed))
+    collection.create_index([('condition', pymongo.ASCENDING), ('published_on', pymongo.DESCENDING),
+                             ('n_rooms', pymongo.ASCENDING), ('surface', pymongo.ASCENDING)], name='filter')
+
+    filter = SimpleNamespace(
+        n_rooms=SimpleNamespace(min=2, max=5),
+        surface=SimpleNamespace(min=40, max=200),
+        condition='BEST'
+    )
+
+    before = explain_statistics(
+        resolver=MongoDBResolver(max_page_size=MAX_PAGE_SIZE, mongodb_client=client, mongodb_connection=connection),
+        filter=filter
+    )
+
+    migrate(collection=collection)
+
+    after = explain_statistics(
+        resolver=MongoDBResolver(max_page_size=MAX_PAGE_SIZE, mongodb_client=client, mongodb_connection=connection,
+                                 precomputed_geohash_prefixes=True),
+        filter=filter
+    )
+
+    print(f'{"":<8}{"index":<24}{"docsExamined":>14}{"keysExamined":>14}{"explain ms":>12}')
+    for name, result in (('before', before), ('after', after)):
+        print(f'{name:<8}{str(result["hint"]):<24}{str(result["docs_examined"]):>14}'
+              f'{str(result["keys_examined"]):>14}{result["elapsed_ms"]:>12.1f}')
+
+    collection.drop()
+
+
+if __name__ == '__main__':
+    main()
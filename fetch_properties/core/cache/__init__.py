@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class TileCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time to live"""
+
+    def __init__(self, max_size: int, ttl: float):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Looks up an entry
+
+        :param key: Key of the entry
+        :return:    Whether the entry has been found and its value
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return False, None
+
+            self.entries.move_to_end(key)
+            return True, value
+
+    def put(self, key: Hashable, value: Any):
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,57 @@
+import csv
+import json
+from dataclasses import dataclass
+from typing import Optional, TextIO
+
+from ..mapper import PropertyRowMapper
+from ..schema import PropertyFilter
+from ..schema.resolver import MongoDBResolver
+from ..schema.tiles import Box
+
+
+EXPORT_FORMAT_NDJSON = 'ndjson'
+EXPORT_FORMAT_CSV = 'csv'
+EXPORT_FORMATS = [EXPORT_FORMAT_NDJSON, EXPORT_FORMAT_CSV]
+EXPORT_COLUMNS = ['id', 'price', 'latitude', 'longitude', 'geohash']
+
+DEFAULT_EXPORT_BATCH_SIZE = 5_000
+
+
+@dataclass
+class PropertiesExporter:
+
+    resolver: MongoDBResolver
+    batch_size: int = DEFAULT_EXPORT_BATCH_SIZE
+
+    def export(self, sink: TextIO, box: Box, filter: Optional[PropertyFilter] = None,
+               format: str = EXPORT_FORMAT_NDJSON) -> int:
+        """Writes every property in a bounding box to a sink, one row at a time
+
+        :param sink:    Text stream the properties are written to
+        :param box:     Bounding box
+        :param filter:  Property filter
+        :param format:  Either ndjson or csv
+        :return:        The number of exported properties
+        """
+
+        if format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported export format {format}, expected one of {EXPORT_FORMATS}')
+
+        writer = None
+        if format == EXPORT_FORMAT_CSV:
+            writer = csv.DictWriter(sink, fieldnames=EXPORT_COLUMNS)
+            writer.writeheader()
+
+        count = 0
+        for result in self.resolver.iterate_properties_in_box(box=box, filter=filter, batch_size=self.batch_size):
+            row = PropertyRowMapper.map(property=result)
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                sink.write(json.dumps(row))
+                sink.write('\n')
+            count += 1
+
+        sink.flush()
+
+        return count
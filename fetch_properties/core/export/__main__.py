@@ -0,0 +1,61 @@
+import argparse
+import sys
+from types import SimpleNamespace
+
+from . import PropertiesExporter, EXPORT_FORMATS, EXPORT_FORMAT_NDJSON, DEFAULT_EXPORT_BATCH_SIZE
+from ..schema.resolver import RESOLVER_REGISTRY
+from ..schema.tiles import Box
+
+
+def parse_arguments():
+
+    parser = argparse.ArgumentParser(description='Exports every property in a bounding box')
+    parser.add_argument('--bottom-left', required=True, help='Bottom left corner as latitude,longitude')
+    parser.add_argument('--top-right', required=True, help='Top right corner as latitude,longitude')
+    parser.add_argument('--n-rooms-min', type=int)
+    parser.add_argument('--n-rooms-max', type=int)
+    parser.add_argument('--surface-min', type=int)
+    parser.add_argument('--surface-max', type=int)
+    parser.add_argument('--condition')
+    parser.add_argument('--market', help='Market to export, the default market if omitted')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default=EXPORT_FORMAT_NDJSON)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_EXPORT_BATCH_SIZE)
+    parser.add_argument('--output', help='Output file, standard output if omitted')
+
+    return parser.parse_args()
+
+
+def main():
+
+    arguments = parse_arguments()
+
+    bottom_left = [float(value) for value in arguments.bottom_left.split(',')]
+    top_right = [float(value) for value in arguments.top_right.split(',')]
+    box = Box(
+        min_latitude=bottom_left[0],
+        min_longitude=bottom_left[1],
+        max_latitude=top_right[0],
+        max_longitude=top_right[1]
+    )
+    filter = SimpleNamespace(
+        n_rooms=SimpleNamespace(min=arguments.n_rooms_min, max=arguments.n_rooms_max),
+        surface=SimpleNamespace(min=arguments.surface_min, max=arguments.surface_max),
+        condition=arguments.condition
+    )
+
+    exporter = PropertiesExporter(
+        resolver=RESOLVER_REGISTRY.get(market=arguments.market),
+        batch_size=arguments.batch_size
+    )
+
+    if arguments.output is None:
+        count = exporter.export(sink=sys.stdout, box=box, filter=filter, format=arguments.format)
+    else:
+        with open(arguments.output, 'w', newline='') as sink:
+            count = exporter.export(sink=sink, box=box, filter=filter, format=arguments.format)
+
+    print(f'Exported {count} properties', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,22 @@
 import json
 import logging
+import os
+import sys
 from dataclasses import dataclass
-from typing import Any, AnyStr, Dict
+from typing import Any, AnyStr, Dict, Optional
 
 from lambda_handler import LambdaHandler
 from .. import FetchPropertiesLambdaCore
+from ..metrics import format_embedded_metrics
 from ..mongodb import MongoDBConnection, MONGODB_CONNECTION
+from ..schema.resolver import SINGLE_FLIGHT
+from ..singleflight import SingleFlight
+
+
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE')
+DEFAULT_METRICS_NAMESPACE = 'FetchProperties'
+METRICS_NAMESPACE = METRICS_NAMESPACE \
+    if METRICS_NAMESPACE and METRICS_NAMESPACE.strip() != '' else DEFAULT_METRICS_NAMESPACE
 
 
 @dataclass(init=False)
@@ -13,11 +24,13 @@ class FetchPropertiesLambda(LambdaHandler):
 
     logger: logging.Logger
     mongodb_connection: MongoDBConnection
+    single_flight: Optional[SingleFlight]
 
-    def __init__(self, logger, mongodb_connection):
+    def __init__(self, logger, mongodb_connection, single_flight=None):
 
         super().__init__(logger=logger)
         self.mongodb_connection = mongodb_connection
+        self.single_flight = single_flight
         self.core = FetchPropertiesLambdaCore(
             logger=self.logger,
             mongodb_connection=mongodb_connection
@@ -26,7 +39,10 @@ class FetchPropertiesLambda(LambdaHandler):
     def run(self, event: Any, context: Any) -> Dict[AnyStr, Any]:
 
         query = event['queryStringParameters'].get('query')
-        response_body = self.core.query(query=query)
+        try:
+            response_body = self.core.query(query=query)
+        finally:
+            self.publish_single_flight_metrics()
 
         return dict(
             statusCode=200,
@@ -34,8 +50,26 @@ class FetchPropertiesLambda(LambdaHandler):
             isBase64Encoded=False
         )
 
+    def publish_single_flight_metrics(self):
+        """Publishes the resolver calls executed and coalesced since the previous invocation as CloudWatch metrics
+
+        The record is written to the standard output rather than logged, because the prefix the Lambda runtime
+        adds to log records would prevent CloudWatch from extracting the metrics.
+        """
+
+        if self.single_flight is None:
+            return
+
+        executed, coalesced = self.single_flight.collect()
+        sys.stdout.write(format_embedded_metrics(
+            namespace=METRICS_NAMESPACE,
+            metrics=dict(SingleFlightExecuted=executed, SingleFlightCoalesced=coalesced)
+        ) + '\n')
+        sys.stdout.flush()
+
 
 LAMBDA_HANDLER = FetchPropertiesLambda(
     logger=logging.getLogger(),
-    mongodb_connection=MONGODB_CONNECTION
+    mongodb_connection=MONGODB_CONNECTION,
+    single_flight=SINGLE_FLIGHT
 )
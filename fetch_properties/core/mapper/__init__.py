@@ -1,7 +1,7 @@
 from typing import Any, AnyStr, Dict, List
 
 from ..schema import Property, PropertyLocation, PropertiesPage, LocalStatistics, GlobalStatistics, Statistics, \
-    PriceStatistics, LocationBoundingBox
+    PriceStatistics, PriceHistogramBucket, LocationBoundingBox
 
 
 class PropertyMapper:
@@ -11,21 +11,41 @@ class PropertyMapper:
 
         cursor = property.get('cursor')
         price = property.get('price')
-        location = property.get('location')
+        location = property.get('location') or {}
+        coordinates = (location.get('point') or {}).get('coordinates')
 
         property_location = PropertyLocation()
-        property_location.latitude = location.get('point').get('coordinates')[1]
-        property_location.longitude = location.get('point').get('coordinates')[0]
+        property_location.latitude = coordinates[1] if coordinates else None
+        property_location.longitude = coordinates[0] if coordinates else None
         property_location.geohash = location.get('geohash')
 
         mapped = Property()
         mapped.id = cursor
         mapped.price = price
         mapped.location = property_location
+        mapped.distance = property.get('distance')
 
         return mapped
 
 
+class PropertyRowMapper:
+
+    @staticmethod
+    def map(property: Dict[AnyStr, Any]) -> Dict[AnyStr, Any]:
+
+        location = property.get('location') or {}
+        coordinates = (location.get('point') or {}).get('coordinates')
+        cursor = property.get('cursor')
+
+        return dict(
+            id=str(cursor) if cursor is not None else None,
+            price=property.get('price'),
+            latitude=coordinates[1] if coordinates else None,
+            longitude=coordinates[0] if coordinates else None,
+            geohash=location.get('geohash')
+        )
+
+
 class PropertiesPageMapper:
 
     @staticmethod
@@ -78,11 +98,30 @@ class GlobalStatisticsMapper:
 class PriceStatisticsMapper:
 
     @staticmethod
-    def map(min_price, max_price, avg_price) -> PriceStatistics:
+    def map(min_price, max_price, avg_price,
+            p25_price=None, median_price=None, p75_price=None,
+            histogram: List[PriceHistogramBucket] = None) -> PriceStatistics:
 
         mapped = PriceStatistics()
         mapped.min = min_price
         mapped.max = max_price
         mapped.avg = avg_price
+        mapped.p25 = p25_price
+        mapped.median = median_price
+        mapped.p75 = p75_price
+        mapped.histogram = histogram
+
+        return mapped
+
+
+class PriceHistogramBucketMapper:
+
+    @staticmethod
+    def map(min_price, max_price, count) -> PriceHistogramBucket:
+
+        mapped = PriceHistogramBucket()
+        mapped.min = min_price
+        mapped.max = max_price
+        mapped.count = count
 
         return mapped
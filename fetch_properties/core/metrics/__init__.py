@@ -0,0 +1,29 @@
+import json
+import time
+from typing import AnyStr, Dict, Optional
+
+
+def format_embedded_metrics(namespace: AnyStr, metrics: Dict[AnyStr, float], unit: AnyStr = 'Count',
+                            timestamp: Optional[float] = None) -> AnyStr:
+    """Formats metrics in the CloudWatch embedded metric format, turned into metrics when written to a Lambda log
+
+    :param namespace:   CloudWatch namespace of the metrics
+    :param metrics:     Value of each metric
+    :param unit:        Unit shared by the metrics
+    :param timestamp:   Time of the metrics in seconds since the epoch, now if omitted
+    :return:            The single line log record
+    """
+
+    return json.dumps({
+        "_aws": {
+            "Timestamp": int((time.time() if timestamp is None else timestamp) * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": namespace,
+                    "Dimensions": [[]],
+                    "Metrics": [dict(Name=name, Unit=unit) for name in metrics]
+                }
+            ]
+        },
+        **metrics
+    })
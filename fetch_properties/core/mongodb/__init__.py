@@ -1,6 +1,7 @@
+import json
 import os
 from dataclasses import dataclass
-from typing import AnyStr
+from typing import AnyStr, Dict
 
 
 MONGODB_URI = os.getenv('MONGODB_URI')
@@ -15,6 +16,14 @@ MONGODB_DATABASE = MONGODB_DATABASE \
 MONGODB_COLLECTION = MONGODB_COLLECTION \
     if MONGODB_COLLECTION and MONGODB_COLLECTION.strip() != '' else DEFAULT_MONGODB_COLLECTION
 
+MONGODB_MARKETS = os.getenv('MONGODB_MARKETS')
+DEFAULT_MARKET = os.getenv('DEFAULT_MARKET')
+DEFAULT_DEFAULT_MARKET = 'default'
+DEFAULT_MARKET = DEFAULT_MARKET if DEFAULT_MARKET and DEFAULT_MARKET.strip() != '' else DEFAULT_DEFAULT_MARKET
+
+GEOHASH_PREFIXES_PRECOMPUTED = os.getenv('GEOHASH_PREFIXES_PRECOMPUTED', '').strip().lower() in ('1', 'true', 'yes')
+GEOHASH_PREFIX_PRECISIONS = [5, 6, 7]
+
 
 @dataclass
 class MongoDBConnection:
@@ -29,3 +38,48 @@ MONGODB_CONNECTION = MongoDBConnection(
     database=MONGODB_DATABASE,
     collection=MONGODB_COLLECTION
 )
+
+
+def get_market_connections(markets: AnyStr, default_connection: MongoDBConnection,
+                           default_market: AnyStr) -> Dict[AnyStr, MongoDBConnection]:
+    """Builds the connection of each market
+
+    :param markets:             JSON object mapping each market to its uri, database and collection, any of which
+                                defaults to the one of the default connection
+    :param default_connection:  Connection of the default market
+    :param default_market:      Name of the default market
+    :return:                    The connections keyed by market
+    """
+
+    connections = {default_market: default_connection}
+    if markets and markets.strip() != '':
+        for market, connection in json.loads(markets).items():
+            connections[market] = MongoDBConnection(
+                uri=connection.get('uri') or default_connection.uri,
+                database=connection.get('database') or default_connection.database,
+                collection=connection.get('collection') or default_connection.collection
+            )
+
+    return connections
+
+
+MONGODB_MARKET_CONNECTIONS = get_market_connections(
+    markets=MONGODB_MARKETS,
+    default_connection=MONGODB_CONNECTION,
+    default_market=DEFAULT_MARKET
+)
+
+
+def get_geohash_prefix_field(precision: int) -> AnyStr:
+
+    return f'location.geohash_{precision}'
+
+
+def get_geohash_prefixes(geohash: AnyStr) -> Dict[AnyStr, AnyStr]:
+    """Computes the geohash prefix fields stored alongside a listing geohash, to be used at ingestion
+
+    :param geohash: Geohash of the listing
+    :return:        The prefix of each supported precision, keyed by the name of its field within location
+    """
+
+    return {f'geohash_{precision}': geohash[:precision] for precision in GEOHASH_PREFIX_PRECISIONS}
@@ -0,0 +1,79 @@
+import argparse
+import pymongo
+from pymongo.collection import Collection
+from typing import AnyStr, List
+
+from . import MONGODB_CONNECTION, GEOHASH_PREFIX_PRECISIONS, get_geohash_prefix_field
+
+
+STATISTICS_INDEX_PRECISION = 7
+
+
+def add_geohash_prefixes(collection: Collection, precisions: List[int] = None) -> int:
+    """Stores the geohash prefix of each precision as a field of the listings missing any of them
+
+    :param collection:  Listings collection
+    :param precisions:  Geohash precisions, every supported precision if omitted
+    :return:            The number of updated listings
+    """
+
+    precisions = precisions or GEOHASH_PREFIX_PRECISIONS
+    result = collection.update_many(
+        {
+            "location.geohash": {"$type": "string"},
+            "$or": [{get_geohash_prefix_field(precision=precision): {"$exists": False}} for precision in precisions]
+        },
+        [
+            {
+                "$set": {
+                    get_geohash_prefix_field(precision=precision): {
+                        "$substrCP": ["$location.geohash", 0, precision]
+                    } for precision in precisions
+                }
+            }
+        ]
+    )
+
+    return result.modified_count
+
+
+def create_statistics_index(collection: Collection, precision: int = STATISTICS_INDEX_PRECISION) -> AnyStr:
+    """Creates the index covering the statistics aggregation: filter fields, sort field, geohash prefix and price
+
+    :param collection:  Listings collection
+    :param precision:   Precision of the geohash prefix the statistics are grouped by
+    :return:            The name of the index
+    """
+
+    return collection.create_index(
+        [
+            ("condition", pymongo.ASCENDING),
+            ("published_on", pymongo.DESCENDING),
+            ("n_rooms", pymongo.ASCENDING),
+            ("surface", pymongo.ASCENDING),
+            (get_geohash_prefix_field(precision=precision), pymongo.ASCENDING),
+            ("price", pymongo.ASCENDING)
+        ],
+        name=f'statistics_geohash_{precision}'
+    )
+
+
+def migrate(collection: Collection) -> int:
+
+    modified_count = add_geohash_prefixes(collection=collection)
+    create_statistics_index(collection=collection)
+
+    return modified_count
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Precomputes listing geohash prefixes and the statistics index')
+    parser.add_argument('--uri', default=MONGODB_CONNECTION.uri)
+    parser.add_argument('--database', default=MONGODB_CONNECTION.database)
+    parser.add_argument('--collection', default=MONGODB_CONNECTION.collection)
+    arguments = parser.parse_args()
+
+    client = pymongo.MongoClient(arguments.uri)
+    updated = migrate(collection=client[arguments.database][arguments.collection])
+    print(f'Updated {updated} listings')
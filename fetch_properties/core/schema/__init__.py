@@ -13,6 +13,7 @@ class Property(graphene.ObjectType):
     id = graphene.String()
     price = graphene.Int()
     location = graphene.Field(PropertyLocation)
+    distance = graphene.Float()
 
 
 class PropertiesPage(graphene.ObjectType):
@@ -21,11 +22,22 @@ class PropertiesPage(graphene.ObjectType):
     page = graphene.String()
 
 
+class PriceHistogramBucket(graphene.ObjectType):
+
+    min = graphene.Int()
+    max = graphene.Int()
+    count = graphene.Int()
+
+
 class PriceStatistics(graphene.ObjectType):
 
     min = graphene.Int()
     max = graphene.Int()
     avg = graphene.Float()
+    p25 = graphene.Float()
+    median = graphene.Float()
+    p75 = graphene.Float()
+    histogram = graphene.List(PriceHistogramBucket)
 
 
 class Point(graphene.ObjectType):
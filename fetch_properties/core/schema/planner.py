@@ -0,0 +1,116 @@
+from dataclasses import dataclass, field
+from typing import Any, AnyStr, Dict, List, Optional, Tuple
+
+from . import PropertyFilter
+
+
+EQUALITY_FILTERS = ['condition']
+RANGE_FILTERS = ['n_rooms', 'surface']
+
+
+@dataclass
+class QueryPlan:
+
+    match: Dict[AnyStr, Any]
+    hint: Optional[AnyStr] = None
+
+    @property
+    def options(self) -> Dict[AnyStr, Any]:
+
+        return dict(hint=self.hint) if self.hint is not None else dict()
+
+
+@dataclass
+class QueryPlanner:
+
+    indexes: Dict[AnyStr, List[Tuple[AnyStr, Any]]] = field(default_factory=dict)
+
+    def plan(self, filter: Optional[PropertyFilter], predicates: Dict[AnyStr, Any] = None,
+             sort: List[AnyStr] = None, projection: List[AnyStr] = None) -> QueryPlan:
+        """Builds the $match predicate of a filter and the index that serves it best
+
+        Omitted filter fields and open range bounds are left out of the predicate. Equality predicates come
+        first, then range predicates, then the additional predicates, all reordered by the key order of the
+        chosen index. A $geoWithin predicate the chosen index does not cover leaves the query unhinted, so that
+        MongoDB remains free to use the geospatial index.
+
+        :param filter:      Property filter, possibly partial or None
+        :param predicates:  Additional predicates, such as location or pagination ones
+        :param sort:        Fields the matching documents are sorted by
+        :param projection:  Fields read from the matching documents, to prefer covering indexes, None if unknown
+        :return:            The query plan
+        """
+
+        match = self.get_filter_predicates(filter=filter)
+        match.update(predicates or {})
+
+        hint, keys = self.get_best_index(fields=list(match.keys()), sort=sort or [], projection=projection)
+        geo_fields = [key for key, value in match.items() if isinstance(value, dict) and "$geoWithin" in value]
+        if any(key not in keys for key in geo_fields):
+            hint = None
+
+        ordered_match = {key: match[key] for key in keys if key in match}
+        ordered_match.update({key: value for key, value in match.items() if key not in ordered_match})
+
+        return QueryPlan(match=ordered_match, hint=hint)
+
+    @staticmethod
+    def get_filter_predicates(filter: Optional[PropertyFilter]) -> Dict[AnyStr, Any]:
+
+        predicates = {}
+        if filter is None:
+            return predicates
+
+        for name in EQUALITY_FILTERS:
+            value = getattr(filter, name, None)
+            if value is not None:
+                predicates[name] = value
+
+        for name in RANGE_FILTERS:
+            int_range = getattr(filter, name, None)
+            if int_range is None:
+                continue
+            bounds = {}
+            if getattr(int_range, 'min', None) is not None:
+                bounds["$gte"] = int_range.min
+            if getattr(int_range, 'max', None) is not None:
+                bounds["$lte"] = int_range.max
+            if len(bounds) > 0:
+                predicates[name] = bounds
+
+        return predicates
+
+    def get_best_index(self, fields: List[AnyStr], sort: List[AnyStr],
+                       projection: List[AnyStr] = None) -> Tuple[Optional[AnyStr], List[AnyStr]]:
+        """Chooses the B-tree index whose key prefix covers the most predicate and sort fields
+
+        Ties are broken in favour of indexes containing every field the query reads, then of shorter indexes.
+
+        :param fields:      Predicate fields
+        :param sort:        Sort fields
+        :param projection:  Fields read from the matching documents, None if unknown
+        :return:            The name of the index, None if no index helps, and its covered key prefix
+        """
+
+        read_fields = None if projection is None else set(fields) | set(sort) | set(projection)
+
+        best_name = None
+        best_keys = []
+        best_rank = None
+        for name, keys in self.indexes.items():
+            covered = []
+            for key, direction in keys:
+                if not isinstance(direction, (int, float)) or (key not in fields and key not in sort):
+                    break
+                covered.append(key)
+            predicate_count = len([key for key in covered if key in fields])
+            if predicate_count == 0:
+                continue
+            covering = read_fields is not None and read_fields.issubset(key for key, _ in keys)
+            rank = (len(covered), covering, -len(keys))
+            if best_rank is None or rank > best_rank:
+                best_name = name
+                best_keys = covered
+                best_rank = rank
+
+        return best_name, best_keys
@@ -1,8 +1,10 @@
 import graphene
 from abc import abstractmethod
+from typing import List
 
-from . import SearchBoundingBox, PropertiesPage, PropertyFilter, Statistics
-from .resolver import RESOLVER_MONGODB
+from . import SearchBoundingBox, SearchLocation, Property, PropertiesPage, PropertyFilter, Statistics
+from .resolver import RESOLVER_REGISTRY
+from .selection import get_selected_fields
 
 
 class Query(graphene.ObjectType):
@@ -10,21 +12,41 @@ class Query(graphene.ObjectType):
     properties_by_bounding_box_and_filter = graphene.Field(
         PropertiesPage,
         bounding_box=graphene.Argument(SearchBoundingBox, required=True),
-        filter=graphene.Argument(PropertyFilter, required=True),
-        page=graphene.Argument(graphene.String, required=False, default_value='')
+        filter=graphene.Argument(PropertyFilter, required=False),
+        page=graphene.Argument(graphene.String, required=False, default_value=''),
+        market=graphene.Argument(graphene.String, required=False)
     )
 
     statistics_by_filter = graphene.Field(
         Statistics,
-        filter=graphene.Argument(PropertyFilter, required=True)
+        filter=graphene.Argument(PropertyFilter, required=False),
+        market=graphene.Argument(graphene.String, required=False)
+    )
+
+    properties_near_point = graphene.Field(
+        graphene.List(Property),
+        point=graphene.Argument(SearchLocation, required=True),
+        filter=graphene.Argument(PropertyFilter, required=False),
+        limit=graphene.Argument(graphene.Int, required=False),
+        market=graphene.Argument(graphene.String, required=False)
+    )
+
+    properties_within_radius = graphene.Field(
+        graphene.List(Property),
+        point=graphene.Argument(SearchLocation, required=True),
+        radius=graphene.Argument(graphene.Float, required=True),
+        filter=graphene.Argument(PropertyFilter, required=False),
+        limit=graphene.Argument(graphene.Int, required=False),
+        market=graphene.Argument(graphene.String, required=False)
     )
 
     @abstractmethod
     def resolve_properties_by_bounding_box_and_filter(
             self, info,
             bounding_box: SearchBoundingBox,
-            filter: PropertyFilter,
-            page: graphene.String
+            filter: PropertyFilter = None,
+            page: graphene.String = '',
+            market: graphene.String = None
     ) -> PropertiesPage:
 
         pass
@@ -32,32 +54,92 @@ class Query(graphene.ObjectType):
     @abstractmethod
     def resolve_statistics_by_filter(
             self, info,
-            filter: PropertyFilter
+            filter: PropertyFilter = None,
+            market: graphene.String = None
     ) -> Statistics:
 
         pass
 
+    @abstractmethod
+    def resolve_properties_near_point(
+            self, info,
+            point: SearchLocation,
+            filter: PropertyFilter = None,
+            limit: graphene.Int = None,
+            market: graphene.String = None
+    ) -> List[Property]:
+
+        pass
+
+    @abstractmethod
+    def resolve_properties_within_radius(
+            self, info,
+            point: SearchLocation,
+            radius: graphene.Float,
+            filter: PropertyFilter = None,
+            limit: graphene.Int = None,
+            market: graphene.String = None
+    ) -> List[Property]:
+
+        pass
+
 
 class MongoDBQuery(Query):
 
     def resolve_properties_by_bounding_box_and_filter(
             self, info,
             bounding_box: SearchBoundingBox,
-            filter: PropertyFilter,
-            page: graphene.String
+            filter: PropertyFilter = None,
+            page: graphene.String = '',
+            market: graphene.String = None
     ) -> PropertiesPage:
 
-        return RESOLVER_MONGODB.find_properties_by_bounding_box_and_filter(
+        return RESOLVER_REGISTRY.get(market=market).find_properties_by_bounding_box_and_filter(
             bounding_box=bounding_box,
             filter=filter,
-            page=page
+            page=page,
+            fields=get_selected_fields(info)
         )
 
     def resolve_statistics_by_filter(
             self, info,
-            filter: PropertyFilter
+            filter: PropertyFilter = None,
+            market: graphene.String = None
     ) -> Statistics:
 
-        return RESOLVER_MONGODB.find_statistics_by_filter(
-            filter=filter
+        return RESOLVER_REGISTRY.get(market=market).find_statistics_by_filter(
+            filter=filter,
+            fields=get_selected_fields(info)
+        )
+
+    def resolve_properties_near_point(
+            self, info,
+            point: SearchLocation,
+            filter: PropertyFilter = None,
+            limit: graphene.Int = None,
+            market: graphene.String = None
+    ) -> List[Property]:
+
+        return RESOLVER_REGISTRY.get(market=market).find_properties_near_point(
+            point=point,
+            filter=filter,
+            limit=limit,
+            fields=get_selected_fields(info)
+        )
+
+    def resolve_properties_within_radius(
+            self, info,
+            point: SearchLocation,
+            radius: graphene.Float,
+            filter: PropertyFilter = None,
+            limit: graphene.Int = None,
+            market: graphene.String = None
+    ) -> List[Property]:
+
+        return RESOLVER_REGISTRY.get(market=market).find_properties_within_radius(
+            point=point,
+            radius=radius,
+            filter=filter,
+            limit=limit,
+            fields=get_selected_fields(info)
         )
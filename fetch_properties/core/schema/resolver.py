@@ -1,21 +1,93 @@
 import bson
 import graphene
+import heapq
+import itertools
+import json
 import os
 import pygeohash
 import pymongo
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from pymongo.command_cursor import CommandCursor
+from typing import Any, AnyStr, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
 
-from . import SearchBoundingBox, PropertyFilter, PropertiesPage, Statistics, LocationBoundingBox, Point
+from . import SearchBoundingBox, SearchLocation, PropertyFilter, Property, PropertiesPage, Statistics, \
+    LocationBoundingBox, Point, PriceStatistics
 from ..mapper import PropertyMapper, PropertiesPageMapper, LocalStatisticsMapper, PriceStatisticsMapper, \
-    GlobalStatisticsMapper, StatisticsMapper
-from ..mongodb import MongoDBConnection, MONGODB_CONNECTION
+    PriceHistogramBucketMapper, GlobalStatisticsMapper, StatisticsMapper
+from .planner import QueryPlan, QueryPlanner
+from .selection import is_selected
+from .tiles import Box, GEOHASH_BASE32, get_covering_blocks, get_covering_precision, get_covering_tiles, \
+    get_splitting_precision, get_tile_box, group_tiles
+from ..cache import TileCache
+from ..singleflight import SingleFlight
+from ..mongodb import MongoDBConnection, MONGODB_CONNECTION, MONGODB_MARKET_CONNECTIONS, DEFAULT_MARKET, \
+    GEOHASH_PREFIXES_PRECOMPUTED, get_geohash_prefix_field
 
 
-MONGODB_CLIENT = pymongo.MongoClient(MONGODB_CONNECTION.uri)
-
 MAX_PAGE_SIZE = int(os.getenv('MONGODB_MAX_PAGE_SIZE'))
 MAX_COLLECTION_SIZE = 20_000
+FIRST_PAGE = '000000000000000000000000'
+
+GEOHASH_PRECISION = 7
+
+PRICE_STATISTICS = ['min', 'max', 'avg', 'p25', 'median', 'p75', 'histogram']
+PRICE_PERCENTILE_STATISTICS = ['p25', 'median', 'p75']
+PRICE_PERCENTILES = [0.25, 0.5, 0.75]
+PERCENTILE_MIN_SERVER_VERSION = (7, 0)
+TOP_N_MIN_SERVER_VERSION = (5, 2)
+
+PRICE_HISTOGRAM_BOUNDARIES = os.getenv('PRICE_HISTOGRAM_BOUNDARIES')
+DEFAULT_PRICE_HISTOGRAM_BOUNDARIES = '0,50000,100000,150000,200000,250000,300000,400000,500000,750000,1000000'
+PRICE_HISTOGRAM_BOUNDARIES = [
+    int(boundary) for boundary in (
+        PRICE_HISTOGRAM_BOUNDARIES
+        if PRICE_HISTOGRAM_BOUNDARIES and PRICE_HISTOGRAM_BOUNDARIES.strip() != ''
+        else DEFAULT_PRICE_HISTOGRAM_BOUNDARIES
+    ).split(',')
+]
+
+SCORE_PRICE_STATISTICS = ['avg', 'median', 'p25', 'p75', 'min', 'max']
+SCORE_PRICE_STATISTIC = os.getenv('SCORE_PRICE_STATISTIC')
+DEFAULT_SCORE_PRICE_STATISTIC = 'avg'
+SCORE_PRICE_STATISTIC = SCORE_PRICE_STATISTIC \
+    if SCORE_PRICE_STATISTIC and SCORE_PRICE_STATISTIC.strip() != '' else DEFAULT_SCORE_PRICE_STATISTIC
+if SCORE_PRICE_STATISTIC not in SCORE_PRICE_STATISTICS:
+    raise ValueError(f'Unknown SCORE_PRICE_STATISTIC {SCORE_PRICE_STATISTIC}, expected one of {SCORE_PRICE_STATISTICS}')
+
+SCATTER_MAX_WORKERS = os.getenv('SCATTER_MAX_WORKERS')
+DEFAULT_SCATTER_MAX_WORKERS = 1
+SCATTER_MAX_WORKERS = int(SCATTER_MAX_WORKERS) \
+    if SCATTER_MAX_WORKERS and SCATTER_MAX_WORKERS.strip() != '' else DEFAULT_SCATTER_MAX_WORKERS
+
+SCATTER_MAX_TILES = os.getenv('SCATTER_MAX_TILES')
+DEFAULT_SCATTER_MAX_TILES = 16
+SCATTER_MAX_TILES = int(SCATTER_MAX_TILES) \
+    if SCATTER_MAX_TILES and SCATTER_MAX_TILES.strip() != '' else DEFAULT_SCATTER_MAX_TILES
+
+SCATTER_MIN_SPAN = os.getenv('SCATTER_MIN_SPAN')
+DEFAULT_SCATTER_MIN_SPAN = 1.0
+SCATTER_MIN_SPAN = float(SCATTER_MIN_SPAN) \
+    if SCATTER_MIN_SPAN and SCATTER_MIN_SPAN.strip() != '' else DEFAULT_SCATTER_MIN_SPAN
+
+TILE_CACHE_SIZE = os.getenv('TILE_CACHE_SIZE')
+DEFAULT_TILE_CACHE_SIZE = 0
+TILE_CACHE_SIZE = int(TILE_CACHE_SIZE) \
+    if TILE_CACHE_SIZE and TILE_CACHE_SIZE.strip() != '' else DEFAULT_TILE_CACHE_SIZE
+
+TILE_CACHE_MAX_TILES = os.getenv('TILE_CACHE_MAX_TILES')
+DEFAULT_TILE_CACHE_MAX_TILES = 64
+TILE_CACHE_MAX_TILES = int(TILE_CACHE_MAX_TILES) \
+    if TILE_CACHE_MAX_TILES and TILE_CACHE_MAX_TILES.strip() != '' else DEFAULT_TILE_CACHE_MAX_TILES
+
+TILE_CACHE_TTL = os.getenv('TILE_CACHE_TTL')
+DEFAULT_TILE_CACHE_TTL = 60.0
+TILE_CACHE_TTL = float(TILE_CACHE_TTL) \
+    if TILE_CACHE_TTL and TILE_CACHE_TTL.strip() != '' else DEFAULT_TILE_CACHE_TTL
+
+SINGLE_FLIGHT_ENABLED = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').strip().lower() in ('1', 'true', 'yes')
 
 
 @dataclass
@@ -27,8 +99,9 @@ class Resolver(ABC):
     def find_properties_by_bounding_box_and_filter(
             self,
             bounding_box: SearchBoundingBox,
-            filter: PropertyFilter,
-            page: graphene.String
+            filter: Optional[PropertyFilter],
+            page: graphene.String,
+            fields: Optional[Set[AnyStr]] = None
     ) -> PropertiesPage:
 
         pass
@@ -36,196 +109,992 @@ class Resolver(ABC):
     @abstractmethod
     def find_statistics_by_filter(
             self,
-            filter: PropertyFilter
+            filter: Optional[PropertyFilter],
+            fields: Optional[Set[AnyStr]] = None
     ) -> Statistics:
 
         pass
 
+    @abstractmethod
+    def find_properties_near_point(
+            self,
+            point: SearchLocation,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        pass
+
+    @abstractmethod
+    def find_properties_within_radius(
+            self,
+            point: SearchLocation,
+            radius: float,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        pass
+
+    @staticmethod
+    def get_page(page: graphene.String) -> AnyStr:
+
+        return FIRST_PAGE if str(page).strip() == '' else page
+
+    def get_limit(self, limit: Optional[int]) -> int:
+
+        return self.max_page_size if limit is None else max(min(limit, self.max_page_size), 0)
+
 
 @dataclass
 class MongoDBResolver(Resolver):
 
-    def __init__(self, max_page_size: int, mongodb_client: pymongo.MongoClient, mongodb_connection: MongoDBConnection):
+    def __init__(self, max_page_size: int, mongodb_client: pymongo.MongoClient, mongodb_connection: MongoDBConnection,
+                 price_histogram_boundaries: List[int] = None,
+                 score_price_statistic: AnyStr = DEFAULT_SCORE_PRICE_STATISTIC,
+                 scatter_max_workers: int = DEFAULT_SCATTER_MAX_WORKERS,
+                 scatter_max_tiles: int = DEFAULT_SCATTER_MAX_TILES,
+                 scatter_min_span: float = DEFAULT_SCATTER_MIN_SPAN,
+                 tile_cache_size: int = DEFAULT_TILE_CACHE_SIZE,
+                 tile_cache_ttl: float = DEFAULT_TILE_CACHE_TTL,
+                 tile_cache_max_tiles: int = DEFAULT_TILE_CACHE_MAX_TILES,
+                 precomputed_geohash_prefixes: bool = False):
 
         super().__init__(max_page_size=max_page_size)
         self.mongodb_client = mongodb_client
         self.mongodb_connection = mongodb_connection
+        self.price_histogram_boundaries = price_histogram_boundaries or PRICE_HISTOGRAM_BOUNDARIES
+        self.score_price_statistic = score_price_statistic
+        self.scatter_max_workers = scatter_max_workers
+        self.scatter_max_tiles = scatter_max_tiles
+        self.scatter_min_span = scatter_min_span
+        self.precomputed_geohash_prefixes = precomputed_geohash_prefixes
+        self.server_version = None
+        self.indexes = None
+        self.executor = None
+        self.tile_cache = TileCache(max_size=tile_cache_size, ttl=tile_cache_ttl) if tile_cache_size > 0 else None
+        self.tile_cache_max_tiles = tile_cache_max_tiles
 
     def find_properties_by_bounding_box_and_filter(
             self,
             bounding_box: SearchBoundingBox,
-            filter: PropertyFilter,
-            page: graphene.String
+            filter: Optional[PropertyFilter],
+            page: graphene.String,
+            fields: Optional[Set[AnyStr]] = None
     ) -> PropertiesPage:
 
-        database = self.mongodb_connection.database
-        collection = self.mongodb_connection.collection
-        page = '000000000000000000000000' if str(page).strip() == '' else page
-        results = self.mongodb_client[database][collection].aggregate([
-            {
-                "$match": {
-                    "location.point": {
-                        "$geoWithin": {
-                            "$box": [
-                                [bounding_box.bottom_left.longitude, bounding_box.bottom_left.latitude],
-                                [bounding_box.top_right.longitude, bounding_box.top_right.latitude]
-                            ]
+        page = self.get_page(page=page)
+        box = Box(
+            min_latitude=bounding_box.bottom_left.latitude,
+            min_longitude=bounding_box.bottom_left.longitude,
+            max_latitude=bounding_box.top_right.latitude,
+            max_longitude=bounding_box.top_right.longitude
+        )
+
+        if self.tile_cache is not None:
+            results = self.find_properties_in_cached_tiles(box=box, filter=filter, page=page)
+        else:
+            scatter_boxes = self.get_scatter_boxes(box=box)
+            if len(scatter_boxes) > 1:
+                tile_results = self.scatter(
+                    lambda tile_box: self.aggregate_properties(
+                        box=tile_box, filter=filter, page=page, fields=fields, with_sort_key=True
+                    ),
+                    scatter_boxes
+                )
+                results = self.merge_properties(tile_results=tile_results)
+            else:
+                results = self.aggregate_properties(box=box, filter=filter, page=page, fields=fields)
+
+        properties = []
+        for result in results:
+            properties.append(PropertyMapper.map(property=result))
+
+        properties_page = PropertiesPageMapper.map(properties=properties)
+
+        return properties_page
+
+    def find_statistics_by_filter(
+            self,
+            filter: Optional[PropertyFilter],
+            fields: Optional[Set[AnyStr]] = None
+    ) -> Statistics:
+
+        with_local_statistics = is_selected(fields, 'local_statistics')
+        with_bounding_box = is_selected(fields, 'local_statistics.bounding_box')
+        with_score = is_selected(fields, 'local_statistics.score')
+        local_price_selection = self.get_selected_price_statistics(fields=fields, prefix='local_statistics.price')
+        global_price_selection = self.get_selected_price_statistics(fields=fields, prefix='global_statistics.price')
+        if with_score:
+            local_price_selection.add(self.score_price_statistic)
+            global_price_selection.add(self.score_price_statistic)
+        with_global_statistics = is_selected(fields, 'global_statistics') or (with_local_statistics and with_score)
+
+        scatter_predicates = self.get_scatter_predicates(filter=filter)
+        filter_key = self.get_filter_key(filter=filter)
+
+        global_price = None
+        if with_global_statistics:
+            if len(scatter_predicates) > 1 and self.is_mergeable(statistics=global_price_selection):
+                global_price = self.merge_prices(prices=self.scatter(
+                    lambda predicates: self.cached(
+                        key=('global_price', self.get_predicates_key(predicates=predicates), filter_key,
+                             tuple(sorted(global_price_selection)), True),
+                        function=lambda: self.aggregate_global_price(
+                            filter=filter, statistics=global_price_selection, predicates=predicates, mergeable=True
+                        )
+                    ),
+                    scatter_predicates
+                ))
+            else:
+                global_price = self.cached(
+                    key=('global_price', None, filter_key, tuple(sorted(global_price_selection)), False),
+                    function=lambda: self.aggregate_global_price(filter=filter, statistics=global_price_selection)
+                )
+
+        global_price_statistics = self.map_price_statistics(price=global_price)
+        global_statistics = GlobalStatisticsMapper.map(price_statistics=global_price_statistics)
+        global_reference_price = getattr(global_price_statistics, self.score_price_statistic)
+
+        local_statistics = []
+        if with_local_statistics:
+            if len(scatter_predicates) > 1:
+                local_results = itertools.chain.from_iterable(self.scatter(
+                    lambda predicates: self.cached(
+                        key=('local_statistics', self.get_predicates_key(predicates=predicates), filter_key,
+                             tuple(sorted(local_price_selection))),
+                        function=lambda: self.aggregate_local_statistics(
+                            filter=filter, statistics=local_price_selection, predicates=predicates
+                        )
+                    ),
+                    scatter_predicates
+                ))
+            else:
+                local_results = self.cached(
+                    key=('local_statistics', None, filter_key, tuple(sorted(local_price_selection))),
+                    function=lambda: self.aggregate_local_statistics(
+                        filter=filter, statistics=local_price_selection
+                    )
+                )
+
+            for result in local_results:
+                price_statistics = self.map_price_statistics(price=result.get('price'))
+                geohash = result.get('geohash')
+                local_statistics.append(LocalStatisticsMapper.map(
+                    price_statistics=price_statistics,
+                    geohash=geohash,
+                    bounding_box=self.get_bounding_box(geohash) if with_bounding_box else None,
+                    score=self.get_score(
+                        getattr(price_statistics, self.score_price_statistic), global_reference_price
+                    ) if with_score else None
+                ))
+
+        result = StatisticsMapper.map(local_statistics=local_statistics, global_statistics=global_statistics)
+
+        return result
+
+    def find_properties_near_point(
+            self,
+            point: SearchLocation,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        results = self.aggregate_properties_near_point(point=point, filter=filter, limit=limit, fields=fields)
+
+        return [PropertyMapper.map(property=result) for result in results]
+
+    def find_properties_within_radius(
+            self,
+            point: SearchLocation,
+            radius: float,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        if radius < 0:
+            raise ValueError(f'Radius must not be negative, got {radius}')
+
+        results = self.aggregate_properties_near_point(
+            point=point, filter=filter, limit=limit, fields=fields, max_distance=radius
+        )
+
+        return [PropertyMapper.map(property=result) for result in results]
+
+    def find_properties_in_cached_tiles(self, box: Box, filter: Optional[PropertyFilter],
+                                        page: AnyStr) -> List[Dict[AnyStr, Any]]:
+        """Finds the first page of properties in a bounding box from the cached geohash tiles covering it
+
+        The box is covered by up to tile_cache_max_tiles tiles, each cached with the first page of its own
+        properties, so that the tiles along the edge of the box are reused as much as the inner ones. Only the
+        tiles missing from the cache are fetched, a single aggregation per rectangular block of missing tiles.
+        The page of a tile, clipped to the box, holds every property of the clipped area down to the oldest
+        property of the tile page: only the clipped areas whose page does not reach the last property of the
+        merged page are queried directly.
+
+        :param box:     Bounding box
+        :param filter:  Property filter
+        :param page:    Cursor of the last property of the previous page
+        :return:        The first page of the properties in the bounding box
+        """
+
+        precision = max(get_covering_precision(box=box, max_tiles=self.tile_cache_max_tiles), 1)
+        tiles = get_covering_tiles(box=box, precision=precision)
+        filter_key = self.get_filter_key(filter=filter)
+
+        tile_results = {}
+        for tile in tiles:
+            hit, results = self.tile_cache.get(('properties', tile, filter_key, str(page)))
+            if hit:
+                tile_results[tile] = results
+
+        missing_tiles = [tile for tile in tiles if tile not in tile_results]
+        if len(missing_tiles) > 0:
+            for tile, results in self.aggregate_tiles_properties(tiles=missing_tiles, filter=filter, page=page):
+                self.tile_cache.put(('properties', tile, filter_key, str(page)), results)
+                tile_results[tile] = results
+
+        clipped_results = {
+            tile: [result for result in tile_results[tile] if self.is_in_box(result=result, box=box)]
+            for tile in tiles
+        }
+        properties = self.merge_properties(tile_results=list(clipped_results.values()))
+
+        incomplete_tiles = [
+            tile for tile in tiles if not self.is_complete(tile_results=tile_results[tile], properties=properties)
+        ]
+        if len(incomplete_tiles) == 0:
+            return properties
+
+        edge_results = self.scatter(
+            lambda tile: self.aggregate_properties(
+                box=get_tile_box(geohash=tile).intersection(box), filter=filter, page=page, fields=None,
+                with_sort_key=True
+            ),
+            incomplete_tiles
+        )
+        clipped_results.update(zip(incomplete_tiles, edge_results))
+
+        return self.merge_properties(tile_results=list(clipped_results.values()))
+
+    def is_complete(self, tile_results: List[Dict[AnyStr, Any]], properties: List[Dict[AnyStr, Any]]) -> bool:
+        """Whether the page of a tile holds every property of the tile that the merged page may contain
+
+        :param tile_results:    Page of the tile, sorted by descending publication date
+        :param properties:      Merged page of the box
+        :return:                True if the tile holds less than a page or if its oldest property is not newer
+                                than the last property of a full merged page
+        """
+
+        if len(tile_results) < self.max_page_size:
+            return True
+
+        if len(properties) < self.max_page_size:
+            return False
+
+        return self.get_sort_key(result=tile_results[-1]) <= self.get_sort_key(result=properties[-1])
+
+    def aggregate_tiles_properties(self, tiles: List[AnyStr], filter: Optional[PropertyFilter],
+                                   page: AnyStr) -> List[Tuple[AnyStr, List[Dict[AnyStr, Any]]]]:
+        """Fetches the first page of properties of each tile, a single aggregation per block of adjacent tiles
+
+        Servers without $topN take an aggregation per tile instead.
+
+        :param tiles:   Geohashes of the tiles, all of the same precision
+        :param filter:  Property filter
+        :param page:    Cursor of the last property of the previous page
+        :return:        Each tile and its properties, sorted by descending publication date
+        """
+
+        if not self.supports_top_n():
+            return list(zip(tiles, self.scatter(
+                lambda tile: self.aggregate_properties(
+                    box=get_tile_box(geohash=tile), filter=filter, page=page, fields=None, with_sort_key=True
+                ),
+                tiles
+            )))
+
+        precision = len(tiles[0])
+        projection = self.get_property_projection(fields=None, prefix='properties')
+        projection["published_on"] = 1
+
+        def aggregate_block(block_box):
+            def plan():
+                query_plan = self.get_query_plan(
+                    filter=filter,
+                    predicates={
+                        **self.get_box_predicates(box=block_box),
+                        "cursor": {
+                            "$gt": bson.ObjectId(oid=page)
                         }
-                    },
-                    "n_rooms": {
-                        "$gte": filter.n_rooms.min,
-                        "$lte": filter.n_rooms.max
-                    },
-                    "surface": {
-                        "$gte": filter.surface.min,
-                        "$lte": filter.surface.max
-                    },
-                    "condition": filter.condition,
+                    }
+                )
+                return [
+                    {"$match": query_plan.match},
+                    {"$project": projection},
+                    {"$group": {
+                        "_id": {"$substr": ["$location.geohash", 0, precision]},
+                        "properties": {
+                            "$topN": {
+                                "n": self.max_page_size,
+                                "sortBy": {"published_on": -1},
+                                "output": "$$ROOT"
+                            }
+                        }
+                    }}
+                ], query_plan
+
+            return list(self.aggregate(plan=plan))
+
+        tile_results = {tile: [] for tile in tiles}
+        for results in self.scatter(aggregate_block, [block_box for block_box, _ in group_tiles(tiles=tiles)]):
+            for result in results:
+                if result.get('_id') in tile_results:
+                    tile_results[result.get('_id')] = result.get('properties')
+
+        return list(tile_results.items())
+
+    @staticmethod
+    def is_in_box(result: Dict[AnyStr, Any], box: Box) -> bool:
+
+        coordinates = ((result.get('location') or {}).get('point') or {}).get('coordinates')
+
+        return coordinates is not None and box.contains(latitude=coordinates[1], longitude=coordinates[0])
+
+    def cached(self, key: Hashable, function: Callable[[], Any]) -> Any:
+
+        if self.tile_cache is None:
+            return function()
+
+        hit, value = self.tile_cache.get(key)
+        if not hit:
+            value = function()
+            self.tile_cache.put(key, value)
+
+        return value
+
+    @staticmethod
+    def get_filter_key(filter: Optional[PropertyFilter]) -> AnyStr:
+
+        return MongoDBResolver.get_predicates_key(predicates=QueryPlanner.get_filter_predicates(filter=filter))
+
+    @staticmethod
+    def get_predicates_key(predicates: Dict[AnyStr, Any]) -> AnyStr:
+
+        return json.dumps(predicates, sort_keys=True, default=str)
+
+    def aggregate_properties(self, box: Box, filter: Optional[PropertyFilter], page: AnyStr,
+                             fields: Optional[Set[AnyStr]], with_sort_key: bool = False) -> List[Dict[AnyStr, Any]]:
+
+        projection = self.get_property_projection(fields=fields, prefix='properties')
+        if with_sort_key:
+            projection["published_on"] = 1
+
+        def plan():
+            query_plan = self.get_query_plan(
+                filter=filter,
+                predicates={
+                    **self.get_box_predicates(box=box),
                     "cursor": {
                         "$gt": bson.ObjectId(oid=page)
                     }
                 }
+            )
+            return [
+                {"$match": query_plan.match},
+                {"$sort": {"published_on": -1}},
+                {"$project": projection},
+                {"$limit": self.max_page_size}
+            ], query_plan
+
+        results = self.aggregate(plan=plan)
+
+        return list(results)
+
+    def aggregate_properties_near_point(self, point: SearchLocation, filter: Optional[PropertyFilter],
+                                        limit: Optional[int], fields: Optional[Set[AnyStr]],
+                                        max_distance: Optional[float] = None) -> List[Dict[AnyStr, Any]]:
+        """Finds the properties closest to a point, nearest first, using the 2dsphere index on location.point
+
+        :param point:           Point the distances are measured from
+        :param filter:          Property filter
+        :param limit:           Maximum number of properties, capped to the page size, none if not positive
+        :param fields:          Selected property fields
+        :param max_distance:    Maximum distance in meters, None for no maximum
+        :return:                The properties, each with its distance in meters
+        """
+
+        limit = self.get_limit(limit=limit)
+        if limit == 0:
+            return []
+
+        database = self.mongodb_connection.database
+        collection = self.mongodb_connection.collection
+        query_plan = self.get_query_plan(filter=filter)
+
+        geo_near = {
+            "near": {
+                "type": "Point",
+                "coordinates": [point.longitude, point.latitude]
             },
-            {"$sort": {"published_on": -1}},
-            {
-                "$project": {
-                    "cursor": 1,
-                    "price": 1,
-                    "location": 1
-                }
-            },
-            {"$limit": self.max_page_size}
+            "key": "location.point",
+            "distanceField": "distance",
+            "spherical": True,
+            "query": query_plan.match
+        }
+        if max_distance is not None:
+            geo_near["maxDistance"] = max_distance
+
+        results = self.mongodb_client[database][collection].aggregate([
+            {"$geoNear": geo_near},
+            {"$limit": limit},
+            {"$project": self.get_property_projection(fields=fields, prefix=None)}
         ])
 
-        properties = []
-        for result in results:
-            properties.append(PropertyMapper.map(property=result))
+        return list(results)
 
-        properties_page = PropertiesPageMapper.map(properties=properties)
+    def iterate_properties_in_box(self, box: Box, filter: Optional[PropertyFilter],
+                                  batch_size: int) -> Iterator[Dict[AnyStr, Any]]:
+        """Iterates over every property in a bounding box, fetching them from MongoDB in batches
 
-        return properties_page
+        :param box:         Bounding box
+        :param filter:      Property filter
+        :param batch_size:  Number of properties fetched from MongoDB per round trip
+        :return:            An iterator over the properties, in no particular order
+        """
+
+        def plan():
+            query_plan = self.get_query_plan(filter=filter, predicates=self.get_box_predicates(box=box))
+            return [
+                {"$match": query_plan.match},
+                {"$project": self.get_property_projection(fields=None, prefix='properties')}
+            ], query_plan
+
+        results = self.aggregate(plan=plan, batchSize=batch_size)
+
+        with results:
+            for result in results:
+                yield result
+
+    def aggregate_global_price(self, filter: Optional[PropertyFilter], statistics: Set[AnyStr],
+                               predicates: Dict[AnyStr, Any] = None,
+                               mergeable: bool = False) -> Optional[Dict[AnyStr, Any]]:
 
-    def find_statistics_by_filter(self, filter: PropertyFilter) -> Statistics:
+        results = self.aggregate(plan=lambda: self.get_statistics_pipeline(
+            filter=filter, statistics=statistics, by_geohash=False, predicates=predicates, mergeable=mergeable
+        ))
+        results = list(results)
+
+        return results[0].get('price') if len(results) > 0 else None
+
+    def aggregate_local_statistics(self, filter: Optional[PropertyFilter], statistics: Set[AnyStr],
+                                   predicates: Dict[AnyStr, Any] = None) -> List[Dict[AnyStr, Any]]:
+
+        results = self.aggregate(plan=lambda: self.get_statistics_pipeline(
+            filter=filter, statistics=statistics, by_geohash=True, predicates=predicates
+        ))
+
+        return list(results)
+
+    def aggregate(self, plan: Callable[[], Tuple[List, QueryPlan]], **options: Any) -> CommandCursor:
+        """Runs an aggregation with the hint of its query plan
+
+        When the hinted index no longer exists, the indexes are listed again and the aggregation is planned
+        and run once more, instead of failing until the next cold start.
+
+        :param plan:    Function building the aggregation pipeline and its query plan
+        :param options: Additional aggregation options
+        :return:        The aggregation cursor
+        """
 
         database = self.mongodb_connection.database
         collection = self.mongodb_connection.collection
 
-        geohash_precision = 7
-        match_filter = {
-                "$match": {
-                    "n_rooms": {
-                        "$gte": filter.n_rooms.min,
-                        "$lte": filter.n_rooms.max
-                    },
-                    "surface": {
-                        "$gte": filter.surface.min,
-                        "$lte": filter.surface.max
-                    },
-                    "condition": filter.condition
-                }
+        pipeline, query_plan = plan()
+        try:
+            return self.mongodb_client[database][collection].aggregate(pipeline, **query_plan.options, **options)
+        except pymongo.errors.OperationFailure as error:
+            if query_plan.hint is None or not self.is_missing_hint_error(error=error):
+                raise
+
+        self.indexes = None
+        pipeline, query_plan = plan()
+
+        return self.mongodb_client[database][collection].aggregate(pipeline, **query_plan.options, **options)
+
+    @staticmethod
+    def is_missing_hint_error(error: pymongo.errors.OperationFailure) -> bool:
+
+        return 'hint provided does not correspond to an existing index' in str(error)
+
+    def get_statistics_pipeline(self, filter: Optional[PropertyFilter], statistics: Set[AnyStr], by_geohash: bool,
+                                predicates: Dict[AnyStr, Any] = None,
+                                mergeable: bool = False) -> Tuple[List, QueryPlan]:
+        """Builds the price statistics aggregation, either per geohash cell or global
+
+        When the geohash prefixes are precomputed, the cell is read from its own field and only the fields
+        the group needs are projected, so that the statistics index can cover the whole aggregation.
+
+        :param filter:      Property filter
+        :param statistics:  Price statistics to compute
+        :param by_geohash:  Whether to group by geohash cell
+        :param predicates:  Predicates of a scattered slice, already restricted to the newest properties,
+                            None to aggregate the MAX_COLLECTION_SIZE newest properties matching the filter
+        :param mergeable:   Whether to compute the price statistics in a mergeable form
+        :return:            The aggregation pipeline and the query plan of its $match stage
+        """
+
+        geohash_prefix_field = get_geohash_prefix_field(precision=GEOHASH_PRECISION)
+        query_plan = self.get_statistics_query_plan(filter=filter, predicates=predicates)
+
+        price_projection = self.get_price_projection(statistics=statistics, mergeable=mergeable)
+        projection = {"_id": 0}
+        if by_geohash:
+            projection["geohash"] = "$_id"
+        if len(price_projection) > 0:
+            projection["price"] = price_projection
+
+        pipeline = [{"$match": query_plan.match}]
+        if predicates is None:
+            pipeline.extend([
+                {"$sort": {"published_on": -1}},
+                {"$limit": MAX_COLLECTION_SIZE}
+            ])
+
+        group_id = None
+        if by_geohash and self.precomputed_geohash_prefixes:
+            group_id = f"${geohash_prefix_field}"
+        elif by_geohash:
+            group_id = {"$substr": ["$location.geohash", 0, GEOHASH_PRECISION]}
+
+        if self.precomputed_geohash_prefixes:
+            pipeline.append({"$project": {"_id": 0, "price": 1, geohash_prefix_field: 1}})
+
+        pipeline.append({
+            "$group": {
+                "_id": group_id,
+                **self.get_price_accumulators(statistics=statistics, mergeable=mergeable)
             }
-        sort_filter = {"$sort": {"published_on": -1}}
-        limit_filter = {"$limit": MAX_COLLECTION_SIZE}
-
-        local_results = self.mongodb_client[database][collection].aggregate([
-            match_filter,
-            sort_filter,
-            limit_filter,
-            {
-                "$group": {
-                    "_id": {
-                        "$substr": ["$location.geohash", 0, geohash_precision]
-                    },
-                    "price_min": {
-                        "$min": "$price"
-                    },
-                    "price_max": {
-                        "$max": "$price"
-                    },
-                    "price_avg": {
-                        "$avg": "$price"
-                    }
+        })
+        if by_geohash and self.precomputed_geohash_prefixes:
+            # Listings ingested without the prefix fields would otherwise make up a cell with no geohash
+            pipeline.append({"$match": {"_id": {"$ne": None}}})
+        pipeline.append({"$project": projection})
+
+        return pipeline, query_plan
+
+    def get_statistics_query_plan(self, filter: Optional[PropertyFilter],
+                                  predicates: Dict[AnyStr, Any] = None) -> QueryPlan:
+
+        return self.get_query_plan(
+            filter=filter,
+            predicates=predicates,
+            projection=[
+                "price", get_geohash_prefix_field(precision=GEOHASH_PRECISION)
+            ] if self.precomputed_geohash_prefixes else None
+        )
+
+    def get_newest_predicates(self, filter: Optional[PropertyFilter]) -> Optional[Dict[AnyStr, Any]]:
+        """Builds the predicates restricting the properties matching a filter to the MAX_COLLECTION_SIZE newest ones
+
+        Properties published on the same date as the last of them are all kept, where a sorted aggregation
+        limited to MAX_COLLECTION_SIZE keeps an arbitrary subset of them.
+
+        :param filter:  Property filter
+        :return:        No predicates if fewer properties match, None if some of the newest properties have no
+                        publication date, so that they cannot be selected by it
+        """
+
+        def plan():
+            query_plan = self.get_query_plan(filter=filter, projection=["published_on"])
+            return [
+                {"$match": query_plan.match},
+                {"$sort": {"published_on": -1}},
+                {"$skip": MAX_COLLECTION_SIZE - 1},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "published_on": 1}}
+            ], query_plan
+
+        results = list(self.aggregate(plan=plan))
+        if len(results) == 0:
+            return {}
+
+        published_on = results[0].get('published_on')
+        if published_on is None:
+            return None
+
+        return {"published_on": {"$gte": published_on}}
+
+    @staticmethod
+    def get_box_predicates(box: Box) -> Dict[AnyStr, Any]:
+
+        return {
+            "location.point": {
+                "$geoWithin": {
+                    "$box": box.to_mongodb_box()
                 }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "geohash": "$_id",
-                    "price": {
-                        "min": "$price_min",
-                        "max": "$price_max",
-                        "avg": "$price_avg"
-                    }
+            }
+        }
+
+    def get_prefix_predicates(self, prefix: Optional[AnyStr]) -> Dict[AnyStr, Any]:
+
+        if prefix is None:
+            return {}
+
+        if self.precomputed_geohash_prefixes and len(prefix) <= GEOHASH_PRECISION:
+            return {get_geohash_prefix_field(precision=GEOHASH_PRECISION): {"$regex": f"^{prefix}"}}
+
+        return {"location.geohash": {"$regex": f"^{prefix}"}}
+
+    def get_executor(self) -> ThreadPoolExecutor:
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.scatter_max_workers)
+
+        return self.executor
+
+    def scatter(self, function: Callable[[Any], Any], items: Iterable[Any]) -> List[Any]:
+
+        return list(self.get_executor().map(function, items))
+
+    def get_scatter_boxes(self, box: Box) -> List[Box]:
+        """Splits a large bounding box into blocks of the geohash tiles covering it, if scatter-gather is enabled
+
+        A box spanning less than scatter_min_span degrees both in latitude and in longitude is not worth the
+        extra aggregations. A larger box is covered, where it actually lies, by the coarsest tiles that number
+        at least scatter_max_tiles, grouped into at most scatter_max_tiles blocks.
+
+        :param box: Bounding box to split
+        :return:    The blocks clipped to the bounding box, or the bounding box itself
+        """
+
+        if self.scatter_max_workers < 2 or self.scatter_max_tiles < 2:
+            return [box]
+
+        span = max(box.max_latitude - box.min_latitude, box.max_longitude - box.min_longitude)
+        if span < self.scatter_min_span:
+            return [box]
+
+        precision = get_splitting_precision(box=box, min_tiles=self.scatter_max_tiles)
+        blocks = get_covering_blocks(box=box, precision=precision, max_blocks=self.scatter_max_tiles)
+
+        return blocks if len(blocks) > 1 else [box]
+
+    def get_scatter_predicates(self, filter: Optional[PropertyFilter]) -> List[Dict[AnyStr, Any]]:
+        """Splits the statistics of a filter by the first geohash character, if scatter-gather is enabled
+
+        The split only pays off when the geohash prefix predicate is served by a key of the chosen index,
+        otherwise every slice would examine every property matching the filter. The slices are restricted to
+        the MAX_COLLECTION_SIZE newest properties matching the filter, so that together they aggregate the same
+        properties as a single aggregation.
+
+        :param filter:  Property filter
+        :return:        The predicates of each slice, or no predicates if the statistics are not split
+        """
+
+        if self.scatter_max_workers < 2:
+            return []
+
+        prefix_predicates = self.get_prefix_predicates(prefix=GEOHASH_BASE32[0])
+        query_plan = self.get_statistics_query_plan(filter=filter, predicates=prefix_predicates)
+        index_keys = [key for key, _ in self.get_indexes().get(query_plan.hint) or []]
+        if not set(prefix_predicates.keys()).issubset(index_keys):
+            return []
+
+        newest_predicates = self.cached(
+            key=('newest_predicates', self.get_filter_key(filter=filter)),
+            function=lambda: self.get_newest_predicates(filter=filter)
+        )
+        if newest_predicates is None:
+            return []
+
+        return [{**self.get_prefix_predicates(prefix=prefix), **newest_predicates} for prefix in GEOHASH_BASE32]
+
+    def merge_properties(self, tile_results: List[List[Dict[AnyStr, Any]]]) -> List[Dict[AnyStr, Any]]:
+        """Merges the properties of each tile, sorted by publication date, into a single page
+
+        :param tile_results:    Properties of each tile, sorted by descending publication date
+        :return:                The first page of the merged properties
+        """
+
+        merged = heapq.merge(*tile_results, key=lambda result: self.get_sort_key(result=result), reverse=True)
+
+        cursors = set()
+        properties = []
+        for result in merged:
+            if result.get('cursor') in cursors:
+                continue
+            cursors.add(result.get('cursor'))
+            properties.append(result)
+            if len(properties) == self.max_page_size:
+                break
+
+        return properties
+
+    @staticmethod
+    def get_sort_key(result: Dict[AnyStr, Any]) -> AnyStr:
+
+        return result.get('published_on') or ''
+
+    @staticmethod
+    def merge_prices(prices: List[Optional[Dict[AnyStr, Any]]]) -> Optional[Dict[AnyStr, Any]]:
+        """Combines mergeable price statistics computed on disjoint sets of properties
+
+        :param prices:  Price statistics of each set, None for empty sets
+        :return:        The combined price statistics, None if every set is empty
+        """
+
+        prices = [price for price in prices if price is not None]
+        if len(prices) == 0:
+            return None
+
+        merged = {}
+        if 'min' in prices[0]:
+            minimums = [price.get('min') for price in prices if price.get('min') is not None]
+            merged['min'] = min(minimums) if len(minimums) > 0 else None
+        if 'max' in prices[0]:
+            maximums = [price.get('max') for price in prices if price.get('max') is not None]
+            merged['max'] = max(maximums) if len(maximums) > 0 else None
+        if 'sum' in prices[0]:
+            total = sum(price.get('sum') or 0 for price in prices)
+            count = sum(price.get('count') or 0 for price in prices)
+            merged['avg'] = total / count if count > 0 else None
+        if 'histogram' in prices[0]:
+            merged['histogram'] = [sum(counts) for counts in zip(*(price.get('histogram') for price in prices))]
+
+        return merged
+
+    def get_indexes(self) -> Dict[AnyStr, List]:
+
+        if self.indexes is None:
+            database = self.mongodb_connection.database
+            collection = self.mongodb_connection.collection
+            index_information = self.mongodb_client[database][collection].index_information()
+            # Sparse and partial indexes miss some documents: hinting them would silently drop results
+            self.indexes = {
+                name: index.get('key') for name, index in index_information.items()
+                if not index.get('sparse') and 'partialFilterExpression' not in index
+            }
+
+        return self.indexes
+
+    def get_query_plan(self, filter: Optional[PropertyFilter], predicates: Dict[AnyStr, Any] = None,
+                       projection: List[AnyStr] = None) -> QueryPlan:
+
+        query_planner = QueryPlanner(indexes=self.get_indexes())
+
+        return query_planner.plan(filter=filter, predicates=predicates, sort=['published_on'], projection=projection)
+
+    @staticmethod
+    def get_property_projection(fields: Optional[Set[AnyStr]], prefix: Optional[AnyStr]) -> Dict[AnyStr, Any]:
+
+        def path(field):
+            return f'{prefix}.{field}' if prefix else field
+
+        projection = {"_id": 0, "cursor": 1}
+
+        if is_selected(fields, path('price')):
+            projection["price"] = 1
+        if is_selected(fields, path('location.latitude')) or is_selected(fields, path('location.longitude')):
+            projection["location.point"] = 1
+        if is_selected(fields, path('location.geohash')):
+            projection["location.geohash"] = 1
+        if is_selected(fields, path('distance')):
+            projection["distance"] = 1
+
+        return projection
+
+    def is_mergeable(self, statistics: Set[AnyStr]) -> bool:
+        """Whether price statistics merged across slices equal the ones of a single aggregation, which is not
+        the case for percentiles computed with $percentile
+        """
+
+        return statistics.isdisjoint(PRICE_PERCENTILE_STATISTICS) or not self.supports_percentile()
+
+    @staticmethod
+    def get_selected_price_statistics(fields: Optional[Set[AnyStr]], prefix: AnyStr) -> Set[AnyStr]:
+
+        return {statistic for statistic in PRICE_STATISTICS if is_selected(fields, f'{prefix}.{statistic}')}
+
+    def get_required_price_statistics(self, statistics: Optional[Set[AnyStr]],
+                                      mergeable: bool = False) -> Set[AnyStr]:
+
+        required = set(PRICE_STATISTICS) if statistics is None else set(statistics)
+        with_percentiles = not required.isdisjoint(PRICE_PERCENTILE_STATISTICS)
+
+        if mergeable:
+            if 'avg' in required:
+                required.discard('avg')
+                required.update(['sum', 'count'])
+            if with_percentiles:
+                required.update(['min', 'max', 'histogram'])
+        elif with_percentiles:
+            if self.supports_percentile():
+                required.add('percentiles')
+            else:
+                required.update(['min', 'max', 'histogram'])
+
+        return required
+
+    def supports_percentile(self) -> bool:
+
+        return self.get_server_version() >= PERCENTILE_MIN_SERVER_VERSION
+
+    def supports_top_n(self) -> bool:
+
+        return self.get_server_version() >= TOP_N_MIN_SERVER_VERSION
+
+    def get_server_version(self) -> Tuple[int, int]:
+
+        if self.server_version is None:
+            server_info = self.mongodb_client.server_info()
+            self.server_version = tuple(server_info.get('versionArray', [0, 0])[:2])
+
+        return self.server_version
+
+    def get_price_accumulators(self, statistics: Optional[Set[AnyStr]] = None,
+                               mergeable: bool = False) -> Dict[AnyStr, Any]:
+
+        required = self.get_required_price_statistics(statistics=statistics, mergeable=mergeable)
+        accumulators = {}
+
+        if 'min' in required:
+            accumulators["price_min"] = {"$min": "$price"}
+        if 'max' in required:
+            accumulators["price_max"] = {"$max": "$price"}
+        if 'avg' in required:
+            accumulators["price_avg"] = {"$avg": "$price"}
+        if 'sum' in required:
+            accumulators["price_sum"] = {"$sum": "$price"}
+        if 'count' in required:
+            accumulators["price_count"] = {
+                "$sum": {
+                    "$cond": [{"$isNumber": "$price"}, 1, 0]
                 }
             }
-        ])
 
-        global_results = self.mongodb_client[database][collection].aggregate([
-            match_filter,
-            sort_filter,
-            limit_filter,
-            {
-                "$group": {
-                    "_id": None,
-                    "price_min": {
-                        "$min": "$price"
-                    },
-                    "price_max": {
-                        "$max": "$price"
-                    },
-                    "price_avg": {
-                        "$avg": "$price"
+        if 'histogram' in required:
+            boundaries = self.price_histogram_boundaries
+            for index, lower_boundary in enumerate(boundaries):
+                conditions = [{"$gte": ["$price", lower_boundary]}]
+                if index + 1 < len(boundaries):
+                    conditions.append({"$lt": ["$price", boundaries[index + 1]]})
+                accumulators[f"price_bucket_{index}"] = {
+                    "$sum": {
+                        "$cond": [{"$and": conditions}, 1, 0]
                     }
                 }
-            },
-            {
-                "$project": {
-                    "_id": 0,
-                    "price": {
-                        "min": "$price_min",
-                        "max": "$price_max",
-                        "avg": "$price_avg"
-                    }
+
+        if 'percentiles' in required:
+            accumulators["price_percentiles"] = {
+                "$percentile": {
+                    "input": "$price",
+                    "p": PRICE_PERCENTILES,
+                    "method": "approximate"
                 }
             }
-        ])
 
-        global_results = list(global_results)
+        return accumulators
+
+    def get_price_projection(self, statistics: Optional[Set[AnyStr]] = None,
+                             mergeable: bool = False) -> Dict[AnyStr, Any]:
+
+        required = self.get_required_price_statistics(statistics=statistics, mergeable=mergeable)
+        projection = {}
 
-        min_price = None
-        max_price = None
-        avg_price = None
-        if len(global_results) > 0:
-            global_result = global_results[0]
-            min_price = global_result.get('price').get('min')
-            max_price = global_result.get('price').get('max')
-            avg_price = global_result.get('price').get('avg')
+        if 'min' in required:
+            projection["min"] = "$price_min"
+        if 'max' in required:
+            projection["max"] = "$price_max"
+        if 'avg' in required:
+            projection["avg"] = "$price_avg"
+        if 'sum' in required:
+            projection["sum"] = "$price_sum"
+        if 'count' in required:
+            projection["count"] = "$price_count"
+        if 'histogram' in required:
+            projection["histogram"] = [
+                f"$price_bucket_{index}" for index in range(len(self.price_histogram_boundaries))
+            ]
+        if 'percentiles' in required:
+            projection["percentiles"] = "$price_percentiles"
 
-        global_price_statistics = PriceStatisticsMapper.map(
+        return projection
+
+    def map_price_statistics(self, price: Optional[Dict[AnyStr, Any]]) -> PriceStatistics:
+
+        if price is None:
+            return PriceStatisticsMapper.map(min_price=None, max_price=None, avg_price=None)
+
+        min_price = price.get('min')
+        max_price = price.get('max')
+        counts = price.get('histogram') or []
+
+        boundaries = self.price_histogram_boundaries
+        histogram = []
+        for index, count in enumerate(counts):
+            upper_boundary = boundaries[index + 1] if index + 1 < len(boundaries) else None
+            histogram.append(PriceHistogramBucketMapper.map(
+                min_price=boundaries[index],
+                max_price=upper_boundary,
+                count=count
+            ))
+
+        percentiles = price.get('percentiles')
+        if percentiles is None:
+            percentiles = [
+                self.get_percentile(
+                    histogram=counts,
+                    boundaries=boundaries,
+                    percentile=percentile,
+                    min_price=min_price,
+                    max_price=max_price
+                ) for percentile in PRICE_PERCENTILES
+            ]
+
+        p25_price, median_price, p75_price = percentiles
+
+        return PriceStatisticsMapper.map(
             min_price=min_price,
             max_price=max_price,
-            avg_price=avg_price
+            avg_price=price.get('avg'),
+            p25_price=p25_price,
+            median_price=median_price,
+            p75_price=p75_price,
+            histogram=histogram
         )
-        global_statistics = GlobalStatisticsMapper.map(price_statistics=global_price_statistics)
 
-        local_statistics = []
-        for result in local_results:
-            price_statistics = PriceStatisticsMapper.map(
-                min_price=result.get('price').get('min'),
-                max_price=result.get('price').get('max'),
-                avg_price=result.get('price').get('avg')
-            )
-            geohash = result.get('geohash')
-            local_statistics.append(LocalStatisticsMapper.map(
-                price_statistics=price_statistics,
-                geohash=geohash,
-                bounding_box=self.get_bounding_box(geohash),
-                score=self.get_score(result.get('price').get('avg'), avg_price)
-            ))
+    @staticmethod
+    def get_percentile(histogram: List[int], boundaries: List[int], percentile: float, min_price, max_price):
+        """Estimates a percentile by linear interpolation inside the fixed-bucket price histogram
 
-        result = StatisticsMapper.map(local_statistics=local_statistics, global_statistics=global_statistics)
+        :param histogram:   Number of prices falling in each bucket
+        :param boundaries:  Lower boundary of each bucket, the last bucket being open-ended
+        :param percentile:  Percentile to estimate, between 0 and 1
+        :param min_price:   Minimum price, used to tighten the first non-empty bucket
+        :param max_price:   Maximum price, used to close the open-ended bucket
+        :return:            The estimated percentile or None if there are no prices
+        """
 
-        return result
+        total = sum(histogram)
+        if total == 0 or min_price is None or max_price is None:
+            return None
+
+        rank = percentile * total
+        cumulative = 0
+        for index, count in enumerate(histogram):
+            if count > 0 and cumulative + count >= rank:
+                lower_price = max(boundaries[index], min_price)
+                upper_price = boundaries[index + 1] if index + 1 < len(boundaries) else max_price
+                upper_price = min(upper_price, max_price)
+                return lower_price + (rank - cumulative) / count * (upper_price - lower_price)
+            cumulative += count
+
+        return max_price
 
     @staticmethod
     def get_bounding_box(geohash) -> LocationBoundingBox:
@@ -265,8 +1134,207 @@ class MongoDBResolver(Resolver):
         return score
 
 
-RESOLVER_MONGODB = MongoDBResolver(
-    mongodb_client=MONGODB_CLIENT,
-    mongodb_connection=MONGODB_CONNECTION,
-    max_page_size=MAX_PAGE_SIZE
+class SingleFlightResolver(Resolver):
+    """Resolver coalescing concurrent identical calls to the resolver it wraps into a single query"""
+
+    def __init__(self, resolver: Resolver, single_flight: SingleFlight):
+
+        super().__init__(max_page_size=resolver.max_page_size)
+        self.resolver = resolver
+        self.single_flight = single_flight
+
+    def __getattr__(self, name: AnyStr) -> Any:
+
+        resolver = self.__dict__.get('resolver')
+        if resolver is None:
+            raise AttributeError(name)
+
+        return getattr(resolver, name)
+
+    def find_properties_by_bounding_box_and_filter(
+            self,
+            bounding_box: SearchBoundingBox,
+            filter: Optional[PropertyFilter],
+            page: graphene.String,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> PropertiesPage:
+
+        return self.single_flight.do(
+            key=self.get_key(
+                'properties_by_bounding_box_and_filter',
+                filter=filter,
+                fields=fields,
+                bounding_box=[
+                    bounding_box.bottom_left.latitude, bounding_box.bottom_left.longitude,
+                    bounding_box.top_right.latitude, bounding_box.top_right.longitude
+                ],
+                page=self.get_page(page=page)
+            ),
+            function=lambda: self.resolver.find_properties_by_bounding_box_and_filter(
+                bounding_box=bounding_box, filter=filter, page=page, fields=fields
+            )
+        )
+
+    def find_statistics_by_filter(
+            self,
+            filter: Optional[PropertyFilter],
+            fields: Optional[Set[AnyStr]] = None
+    ) -> Statistics:
+
+        return self.single_flight.do(
+            key=self.get_key('statistics_by_filter', filter=filter, fields=fields),
+            function=lambda: self.resolver.find_statistics_by_filter(filter=filter, fields=fields)
+        )
+
+    def find_properties_near_point(
+            self,
+            point: SearchLocation,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        return self.single_flight.do(
+            key=self.get_key(
+                'properties_near_point',
+                filter=filter,
+                fields=fields,
+                point=[point.latitude, point.longitude],
+                limit=self.get_limit(limit=limit)
+            ),
+            function=lambda: self.resolver.find_properties_near_point(
+                point=point, filter=filter, limit=limit, fields=fields
+            )
+        )
+
+    def find_properties_within_radius(
+            self,
+            point: SearchLocation,
+            radius: float,
+            filter: Optional[PropertyFilter],
+            limit: Optional[int] = None,
+            fields: Optional[Set[AnyStr]] = None
+    ) -> List[Property]:
+
+        return self.single_flight.do(
+            key=self.get_key(
+                'properties_within_radius',
+                filter=filter,
+                fields=fields,
+                point=[point.latitude, point.longitude],
+                radius=radius,
+                limit=self.get_limit(limit=limit)
+            ),
+            function=lambda: self.resolver.find_properties_within_radius(
+                point=point, radius=radius, filter=filter, limit=limit, fields=fields
+            )
+        )
+
+    def get_key(self, operation: AnyStr, filter: Optional[PropertyFilter], fields: Optional[Set[AnyStr]],
+                **arguments: Any) -> AnyStr:
+        """Builds the key of a call from its normalized arguments, so that equivalent calls share the same key
+
+        :param operation:   Name of the resolver operation
+        :param filter:      Property filter, keyed by the predicates it translates to
+        :param fields:      Selected fields
+        :param arguments:   Other arguments of the call, already normalized
+        :return:            The key of the call, specific to the wrapped resolver
+        """
+
+        return json.dumps(
+            dict(
+                resolver=id(self.resolver),
+                operation=operation,
+                filter=QueryPlanner.get_filter_predicates(filter=filter),
+                fields=sorted(fields) if fields is not None else None,
+                **arguments
+            ),
+            sort_keys=True,
+            default=str
+        )
+
+
+class MongoDBClientRegistry:
+    """Lazily creates one MongoDB client per cluster URI, shared by every market on that cluster"""
+
+    def __init__(self):
+
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def get(self, uri: AnyStr) -> pymongo.MongoClient:
+
+        with self.lock:
+            client = self.clients.get(uri)
+            if client is None:
+                client = pymongo.MongoClient(uri)
+                self.clients[uri] = client
+
+        return client
+
+
+class ResolverRegistry:
+    """Lazily creates the resolver of each market, on top of the shared MongoDB clients"""
+
+    def __init__(self, connections: Dict[AnyStr, MongoDBConnection], default_market: AnyStr,
+                 client_registry: MongoDBClientRegistry, single_flight: Optional[SingleFlight] = None):
+
+        self.connections = connections
+        self.default_market = default_market
+        self.client_registry = client_registry
+        self.single_flight = single_flight
+        self.resolvers = {}
+        self.lock = threading.Lock()
+
+    def get(self, market: Optional[AnyStr] = None) -> Resolver:
+
+        market = self.default_market if market is None or market.strip() == '' else market
+        connection = self.connections.get(market)
+        if connection is None:
+            raise ValueError(f'Unknown market {market}, expected one of {sorted(self.connections.keys())}')
+
+        with self.lock:
+            resolver = self.resolvers.get(market)
+            if resolver is None:
+                resolver = self.create_resolver(connection=connection)
+                self.resolvers[market] = resolver
+
+        return resolver
+
+    def create_resolver(self, connection: MongoDBConnection) -> Resolver:
+
+        resolver = MongoDBResolver(
+            mongodb_client=self.client_registry.get(uri=connection.uri),
+            mongodb_connection=connection,
+            max_page_size=MAX_PAGE_SIZE,
+            price_histogram_boundaries=PRICE_HISTOGRAM_BOUNDARIES,
+            score_price_statistic=SCORE_PRICE_STATISTIC,
+            scatter_max_workers=SCATTER_MAX_WORKERS,
+            scatter_max_tiles=SCATTER_MAX_TILES,
+            scatter_min_span=SCATTER_MIN_SPAN,
+            tile_cache_size=TILE_CACHE_SIZE,
+            tile_cache_ttl=TILE_CACHE_TTL,
+            tile_cache_max_tiles=TILE_CACHE_MAX_TILES,
+            precomputed_geohash_prefixes=GEOHASH_PREFIXES_PRECOMPUTED
+        )
+
+        if self.single_flight is not None:
+            resolver = SingleFlightResolver(resolver=resolver, single_flight=self.single_flight)
+
+        return resolver
+
+
+MONGODB_CLIENT_REGISTRY = MongoDBClientRegistry()
+
+MONGODB_CLIENT = MONGODB_CLIENT_REGISTRY.get(uri=MONGODB_CONNECTION.uri)
+
+SINGLE_FLIGHT = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+
+RESOLVER_REGISTRY = ResolverRegistry(
+    connections=MONGODB_MARKET_CONNECTIONS,
+    default_market=DEFAULT_MARKET,
+    client_registry=MONGODB_CLIENT_REGISTRY,
+    single_flight=SINGLE_FLIGHT
 )
+
+RESOLVER_MONGODB = RESOLVER_REGISTRY.get(market=DEFAULT_MARKET)
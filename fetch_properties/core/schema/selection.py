@@ -0,0 +1,58 @@
+from graphene.utils.str_converters import to_snake_case
+from typing import Any, AnyStr, Dict, Optional, Set
+
+
+FRAGMENT_SPREAD_NODES = ('FragmentSpread', 'FragmentSpreadNode')
+INLINE_FRAGMENT_NODES = ('InlineFragment', 'InlineFragmentNode')
+
+
+def get_selected_fields(info: Any) -> Set[AnyStr]:
+    """Collects the fields selected below the field being resolved
+
+    :param info:    GraphQL resolve info of the field being resolved
+    :return:        The dotted snake_case paths of every selected field, including intermediate ones
+    """
+
+    field_nodes = getattr(info, 'field_nodes', None) or getattr(info, 'field_asts', None) or []
+    fragments = getattr(info, 'fragments', None) or {}
+
+    fields = set()
+    for field_node in field_nodes:
+        collect_selected_fields(
+            selection_set=field_node.selection_set,
+            prefix='',
+            fragments=fragments,
+            fields=fields
+        )
+
+    return fields
+
+
+def collect_selected_fields(selection_set: Any, prefix: AnyStr, fragments: Dict[AnyStr, Any], fields: Set[AnyStr]):
+
+    if selection_set is None:
+        return
+
+    for selection in selection_set.selections:
+        node = type(selection).__name__
+        if node in FRAGMENT_SPREAD_NODES:
+            fragment = fragments.get(selection.name.value)
+            if fragment is not None:
+                collect_selected_fields(fragment.selection_set, prefix, fragments, fields)
+        elif node in INLINE_FRAGMENT_NODES:
+            collect_selected_fields(selection.selection_set, prefix, fragments, fields)
+        elif not selection.name.value.startswith('__'):
+            path = prefix + to_snake_case(selection.name.value)
+            fields.add(path)
+            collect_selected_fields(selection.selection_set, path + '.', fragments, fields)
+
+
+def is_selected(fields: Optional[Set[AnyStr]], path: AnyStr) -> bool:
+    """Tells whether a field has been selected, no selection meaning every field
+
+    :param fields:  Selected fields as returned by get_selected_fields or None
+    :param path:    Dotted snake_case path of the field
+    :return:        True if the field has to be resolved
+    """
+
+    return fields is None or path in fields
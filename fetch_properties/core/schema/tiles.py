@@ -0,0 +1,247 @@
+import math
+import pygeohash
+from dataclasses import dataclass
+from typing import AnyStr, List, Optional, Tuple
+
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_MAX_PRECISION = 12
+
+
+@dataclass(frozen=True)
+class Box:
+
+    min_latitude: float
+    min_longitude: float
+    max_latitude: float
+    max_longitude: float
+
+    def intersection(self, other: 'Box') -> Optional['Box']:
+
+        box = Box(
+            min_latitude=max(self.min_latitude, other.min_latitude),
+            min_longitude=max(self.min_longitude, other.min_longitude),
+            max_latitude=min(self.max_latitude, other.max_latitude),
+            max_longitude=min(self.max_longitude, other.max_longitude)
+        )
+
+        return box if box.min_latitude <= box.max_latitude and box.min_longitude <= box.max_longitude else None
+
+    def within(self, other: 'Box') -> bool:
+
+        return other.min_latitude <= self.min_latitude and self.max_latitude <= other.max_latitude and \
+            other.min_longitude <= self.min_longitude and self.max_longitude <= other.max_longitude
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+
+        return self.min_latitude <= latitude <= self.max_latitude and \
+            self.min_longitude <= longitude <= self.max_longitude
+
+    def to_mongodb_box(self) -> List[List[float]]:
+
+        return [[self.min_longitude, self.min_latitude], [self.max_longitude, self.max_latitude]]
+
+
+def get_tile_box(geohash: AnyStr) -> Box:
+    """Computes the box covered by a geohash tile
+
+    :param geohash: Geohash of the tile
+    :return:        The box covered by the tile
+    """
+
+    decoded = pygeohash.decode_exactly(geohash)
+
+    return Box(
+        min_latitude=decoded[0] - decoded[2],
+        min_longitude=decoded[1] - decoded[3],
+        max_latitude=decoded[0] + decoded[2],
+        max_longitude=decoded[1] + decoded[3]
+    )
+
+
+def get_tile_size(precision: int) -> Tuple[float, float]:
+
+    latitude_bits = (5 * precision) // 2
+    longitude_bits = 5 * precision - latitude_bits
+
+    return 180 / 2 ** latitude_bits, 360 / 2 ** longitude_bits
+
+
+def get_tile_range(box: Box, precision: int) -> Tuple[range, range]:
+
+    tile_latitude, tile_longitude = get_tile_size(precision=precision)
+    latitude_count = int(round(180 / tile_latitude))
+    longitude_count = int(round(360 / tile_longitude))
+
+    def index(value, origin, size, count):
+        return min(max(int(math.floor((value - origin) / size)), 0), count - 1)
+
+    latitudes = range(
+        index(box.min_latitude, -90, tile_latitude, latitude_count),
+        index(box.max_latitude, -90, tile_latitude, latitude_count) + 1
+    )
+    longitudes = range(
+        index(box.min_longitude, -180, tile_longitude, longitude_count),
+        index(box.max_longitude, -180, tile_longitude, longitude_count) + 1
+    )
+
+    return latitudes, longitudes
+
+
+def get_covering_tiles(box: Box, precision: int) -> List[AnyStr]:
+    """Lists the geohash tiles of a given precision covering a box
+
+    :param box:         Box to cover
+    :param precision:   Geohash precision of the tiles
+    :return:            The geohashes of the covering tiles
+    """
+
+    tile_latitude, tile_longitude = get_tile_size(precision=precision)
+    latitudes, longitudes = get_tile_range(box=box, precision=precision)
+
+    return [
+        pygeohash.encode(
+            latitude=-90 + (latitude + 0.5) * tile_latitude,
+            longitude=-180 + (longitude + 0.5) * tile_longitude,
+            precision=precision
+        )
+        for latitude in latitudes for longitude in longitudes
+    ]
+
+
+def get_covering_precision(box: Box, max_tiles: int) -> int:
+    """Finds the finest geohash precision covering a box with at most a given number of tiles, wherever it lies
+
+    The precision only depends on the dimensions of the box, assuming the worst alignment with the tiles, so that
+    panning a box of constant size keeps the same precision and reuses the tiles already fetched.
+
+    :param box:         Box to cover
+    :param max_tiles:   Maximum number of tiles
+    :return:            The geohash precision, 0 if even a single character tile is too fine
+    """
+
+    latitude_span = box.max_latitude - box.min_latitude
+    longitude_span = box.max_longitude - box.min_longitude
+
+    precision = 0
+    for candidate in range(1, GEOHASH_MAX_PRECISION + 1):
+        tile_latitude, tile_longitude = get_tile_size(precision=candidate)
+        tile_count = (math.ceil(latitude_span / tile_latitude) + 1) * (math.ceil(longitude_span / tile_longitude) + 1)
+        if tile_count > max_tiles:
+            break
+        precision = candidate
+
+    return precision
+
+
+def get_splitting_precision(box: Box, min_tiles: int) -> int:
+    """Finds the coarsest geohash precision covering a box, where it actually lies, with at least a given number
+    of tiles
+
+    :param box:         Box to cover
+    :param min_tiles:   Minimum number of tiles
+    :return:            The geohash precision, the finest one if no precision covers the box with enough tiles
+    """
+
+    for precision in range(1, GEOHASH_MAX_PRECISION + 1):
+        latitudes, longitudes = get_tile_range(box=box, precision=precision)
+        if len(latitudes) * len(longitudes) >= min_tiles:
+            return precision
+
+    return GEOHASH_MAX_PRECISION
+
+
+def get_covering_blocks(box: Box, precision: int, max_blocks: int) -> List[Box]:
+    """Groups the geohash tiles of a given precision covering a box into rectangular blocks clipped to the box
+
+    The rows and the columns of tiles are split as evenly as possible, so that the blocks hold about the same
+    number of tiles.
+
+    :param box:         Box to cover
+    :param precision:   Geohash precision of the tiles
+    :param max_blocks:  Maximum number of blocks
+    :return:            The blocks, at most max_blocks of them
+    """
+
+    tile_latitude, tile_longitude = get_tile_size(precision=precision)
+    latitudes, longitudes = get_tile_range(box=box, precision=precision)
+
+    rows, columns = max(
+        (
+            (rows, min(len(longitudes), max_blocks // rows))
+            for rows in range(1, min(len(latitudes), max_blocks) + 1)
+        ),
+        key=lambda shape: (shape[0] * shape[1], -abs(shape[0] - shape[1]))
+    )
+
+    def split(tiles, count):
+        return [tiles[len(tiles) * index // count:len(tiles) * (index + 1) // count] for index in range(count)]
+
+    blocks = []
+    for latitude_tiles in split(latitudes, rows):
+        for longitude_tiles in split(longitudes, columns):
+            block = Box(
+                min_latitude=-90 + latitude_tiles.start * tile_latitude,
+                min_longitude=-180 + longitude_tiles.start * tile_longitude,
+                max_latitude=-90 + latitude_tiles.stop * tile_latitude,
+                max_longitude=-180 + longitude_tiles.stop * tile_longitude
+            ).intersection(box)
+            if block is not None:
+                blocks.append(block)
+
+    return blocks
+
+
+def group_tiles(tiles: List[AnyStr]) -> List[Tuple[Box, List[AnyStr]]]:
+    """Groups geohash tiles of the same precision into rectangular blocks of adjacent tiles
+
+    Each row of tiles is split into runs of adjacent tiles, and a run extends the block of the previous row
+    spanning the same columns, so that a strip of tiles makes up a single block.
+
+    :param tiles:   Geohashes of the tiles
+    :return:        The box of each block and the geohashes of its tiles
+    """
+
+    cells = {}
+    for tile in tiles:
+        tile_box = get_tile_box(geohash=tile)
+        tile_latitude, tile_longitude = get_tile_size(precision=len(tile))
+        row = int(round((tile_box.min_latitude + 90) / tile_latitude))
+        column = int(round((tile_box.min_longitude + 180) / tile_longitude))
+        cells[(row, column)] = tile
+
+    blocks = []
+    open_blocks = {}
+    previous_row = None
+    for row in sorted({row for row, _ in cells}):
+        if previous_row is None or row != previous_row + 1:
+            open_blocks = {}
+        runs = []
+        for column in sorted(column for cell_row, column in cells if cell_row == row):
+            if len(runs) > 0 and runs[-1][-1] == column - 1:
+                runs[-1].append(column)
+            else:
+                runs.append([column])
+        next_open_blocks = {}
+        for run in runs:
+            span = (run[0], run[-1])
+            block = open_blocks.get(span)
+            if block is None:
+                block = []
+                blocks.append(block)
+            block.extend(cells[(row, column)] for column in run)
+            next_open_blocks[span] = block
+        open_blocks = next_open_blocks
+        previous_row = row
+
+    grouped = []
+    for block in blocks:
+        tile_boxes = [get_tile_box(geohash=tile) for tile in block]
+        grouped.append((Box(
+            min_latitude=min(tile_box.min_latitude for tile_box in tile_boxes),
+            min_longitude=min(tile_box.min_longitude for tile_box in tile_boxes),
+            max_latitude=max(tile_box.max_latitude for tile_box in tile_boxes),
+            max_longitude=max(tile_box.max_longitude for tile_box in tile_boxes)
+        ), block))
+
+    return grouped
@@ -0,0 +1,92 @@
+import asyncio
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    """Coalesces concurrent calls sharing a key into a single execution whose result they all receive
+
+    Threads and coroutines share the same in-flight calls, so a coroutine can wait for a call started by a thread
+    and the other way round.
+    """
+
+    def __init__(self):
+
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+        self.collected = (0, 0)
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Any:
+        """Runs a function unless a call with the same key is in flight, in which case waits for its result
+
+        :param key:         Key identifying identical calls
+        :param function:    Function to run
+        :return:            The result of the function, possibly obtained by another caller
+        """
+
+        future, leader = self.join(key=key)
+        if not leader:
+            return future.result()
+
+        return self.lead(key=key, future=future, function=function)
+
+    async def do_async(self, key: Hashable, function: Callable[[], Any], executor: Optional[Executor] = None) -> Any:
+        """Same as do, running the blocking function in an executor instead of blocking the event loop
+
+        :param key:         Key identifying identical calls
+        :param function:    Blocking function to run
+        :param executor:    Executor running the function, the default executor of the event loop if omitted
+        :return:            The result of the function, possibly obtained by another caller
+        """
+
+        future, leader = self.join(key=key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(executor, self.lead, key, future, function)
+
+    def join(self, key: Hashable) -> Tuple[Future, bool]:
+
+        with self.lock:
+            future = self.calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+
+            future = Future()
+            self.calls[key] = future
+            self.executed += 1
+            return future, True
+
+    def lead(self, key: Hashable, future: Future, function: Callable[[], Any]) -> Any:
+
+        try:
+            result = function()
+        except BaseException as exception:
+            with self.lock:
+                del self.calls[key]
+            future.set_exception(exception)
+            raise
+
+        with self.lock:
+            del self.calls[key]
+        future.set_result(result)
+
+        return result
+
+    def collect(self) -> Tuple[int, int]:
+        """Counts the calls since the previous collection, so that each call is reported exactly once
+
+        :return:    The number of calls executed and the number of calls coalesced into another one
+        """
+
+        with self.lock:
+            executed, coalesced = self.collected
+            self.collected = (self.executed, self.coalesced)
+
+            return self.executed - executed, self.coalesced - coalesced
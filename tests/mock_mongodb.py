@@ -0,0 +1,51 @@
+import pymongo.errors
+
+
+class MockCursor:
+    """Cursor over the results of an aggregation, closed when leaving its context"""
+
+    def __init__(self, results):
+
+        self.results = iter(results)
+        self.closed = False
+
+    def __iter__(self):
+
+        return self.results
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, *exception):
+
+        self.closed = True
+
+
+class MockCollection:
+    """Collection recording the aggregations it receives, answering them with a function of the pipeline"""
+
+    def __init__(self, indexes, results=None, dropped_indexes=None):
+
+        self.indexes = indexes
+        self.results = results or (lambda pipeline: [])
+        self.dropped_indexes = dropped_indexes or []
+        self.pipelines = []
+        self.hints = []
+        self.options = []
+
+    def index_information(self):
+
+        return {name: index for name, index in self.indexes.items() if name not in self.dropped_indexes}
+
+    def aggregate(self, pipeline, **options):
+
+        hint = options.get('hint')
+        self.hints.append(hint)
+        if hint in self.dropped_indexes:
+            raise pymongo.errors.OperationFailure('hint provided does not correspond to an existing index', code=2)
+
+        self.pipelines.append(pipeline)
+        self.options.append(options)
+
+        return MockCursor(self.results(pipeline))
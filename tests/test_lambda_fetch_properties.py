@@ -1,8 +1,13 @@
 import bson
+import csv
+import io
 import json
 import os
 import pymongo
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest import mock
 
 from testcontainers.mongodb import MongoDbContainer
 
@@ -15,6 +20,7 @@ class TestFetchPropertiesLambda(unittest.TestCase):
     @classmethod
     def setUpClass(cls) -> None:
 
+        os.environ['MONGODB_MARKETS'] = json.dumps(dict(IT=dict(collection='properties_it')))
         MONGODB_CONTAINER.start()
 
     def testRunWhenReceiveApiGatewayEventAndQueryWithNoCursor(self):
@@ -258,6 +264,539 @@ class TestFetchPropertiesLambda(unittest.TestCase):
 
         mock_mongodb_client.drop_database(mongodb_database)
 
+    def testRunWhenReceiveApiGatewayEventAndObtainPercentileStatistics(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-4.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-5.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+        global_price = actual_body['data']['statisticsByFilter']['globalStatistics']['price']
+        local_statistics = actual_body['data']['statisticsByFilter']['localStatistics']
+
+        self.assertEqual(135000, global_price['min'])
+        self.assertEqual(350000, global_price['max'])
+        self.assertLessEqual(global_price['min'], global_price['p25'])
+        self.assertLessEqual(global_price['p25'], global_price['median'])
+        self.assertLessEqual(global_price['median'], global_price['p75'])
+        self.assertLessEqual(global_price['p75'], global_price['max'])
+        self.assertEqual(3, sum(bucket['count'] for bucket in global_price['histogram']))
+
+        for local_statistic in local_statistics:
+            self.assertEqual(local_statistic['price']['min'], local_statistic['price']['median'])
+            self.assertEqual(1, sum(bucket['count'] for bucket in local_statistic['price']['histogram']))
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventAndObtainPercentileStatisticsBeforeMongoDB7(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-4.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-5.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+        from fetch_properties.core.mongodb import DEFAULT_MARKET
+        from fetch_properties.core.schema.resolver import MongoDBResolver, MONGODB_CLIENT, RESOLVER_REGISTRY
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        resolver = MongoDBResolver(max_page_size=2, mongodb_client=MONGODB_CLIENT,
+                                   mongodb_connection=mongodb_connection)
+        resolver.server_version = (6, 0)
+
+        with mock.patch.dict(RESOLVER_REGISTRY.resolvers, {DEFAULT_MARKET: resolver}):
+            actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+        global_price = actual_body['data']['statisticsByFilter']['globalStatistics']['price']
+        local_statistics = actual_body['data']['statisticsByFilter']['localStatistics']
+
+        self.assertEqual(135000, global_price['min'])
+        self.assertEqual(350000, global_price['max'])
+        self.assertEqual(146250, global_price['p25'])
+        self.assertEqual(275000, global_price['median'])
+        self.assertEqual(312500, global_price['p75'])
+
+        for local_statistic in local_statistics:
+            self.assertEqual(local_statistic['price']['min'], local_statistic['price']['median'])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventAndQueryStatisticsWithPartialFilter(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-4.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-6.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+        expected_global_statistics = dict(price=dict(min=135000, max=350000))
+
+        self.assertDictEqual(expected_global_statistics, actual_body['data']['statisticsByFilter']['globalStatistics'])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testExportWhenPropertiesInBoundingBox(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-1.json', 'r') as file:
+            collection = json.load(file)
+
+        from fetch_properties.core.export import PropertiesExporter
+        from fetch_properties.core.handler import MONGODB_CONNECTION
+        from fetch_properties.core.schema.resolver import RESOLVER_MONGODB
+        from fetch_properties.core.schema.tiles import Box
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        box = Box(min_latitude=44.0567, min_longitude=5.3846, max_latitude=46.1102, max_longitude=9.9208)
+        sink = io.StringIO()
+        exporter = PropertiesExporter(resolver=RESOLVER_MONGODB, batch_size=1)
+        count = exporter.export(sink=sink, box=box, format='ndjson')
+
+        rows = [json.loads(line) for line in sink.getvalue().splitlines()]
+        expected_ids = [str(document['cursor']) for document in collection]
+
+        self.assertEqual(len(collection), count)
+        self.assertCountEqual(expected_ids, [row['id'] for row in rows])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testExportWhenPropertiesInBoundingBoxMatchPartialFilterAsCsv(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-1.json', 'r') as file:
+            collection = json.load(file)
+
+        from fetch_properties.core.export import PropertiesExporter, EXPORT_COLUMNS
+        from fetch_properties.core.handler import MONGODB_CONNECTION
+        from fetch_properties.core.schema.resolver import RESOLVER_MONGODB
+        from fetch_properties.core.schema.tiles import Box
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        box = Box(min_latitude=44.0567, min_longitude=5.3846, max_latitude=46.1102, max_longitude=9.9208)
+        filter = SimpleNamespace(n_rooms=SimpleNamespace(min=2, max=None), surface=None, condition='BEST')
+        sink = io.StringIO()
+        exporter = PropertiesExporter(resolver=RESOLVER_MONGODB, batch_size=1)
+        count = exporter.export(sink=sink, box=box, filter=filter, format='csv')
+
+        lines = sink.getvalue().splitlines()
+        expected_rows = [
+            dict(
+                id=str(document['cursor']),
+                price=str(document['price']),
+                latitude=str(document['location']['point']['coordinates'][1]),
+                longitude=str(document['location']['point']['coordinates'][0]),
+                geohash=document['location']['geohash']
+            )
+            for document in collection if document['n_rooms'] >= 2 and document['condition'] == 'BEST'
+        ]
+
+        self.assertEqual(2, count)
+        self.assertEqual(','.join(EXPORT_COLUMNS), lines[0])
+        self.assertCountEqual(expected_rows, [dict(row) for row in csv.DictReader(lines)])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventAndQueryPropertiesNearPoint(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-1.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-7.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+        mock_mongodb_client[mongodb_database][mongodb_collection].create_index([('location.point', pymongo.GEOSPHERE)])
+
+        actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+        properties = actual_body['data']['propertiesNearPoint']
+
+        self.assertEqual(2, len(properties))
+        self.assertEqual('5ffc13f406610351150ae45a', properties[0]['id'])
+        self.assertAlmostEqual(0.0, properties[0]['distance'])
+        self.assertLessEqual(properties[0]['distance'], properties[1]['distance'])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventAndQueryWithMarket(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-1.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-8.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        with open('resources/response-body-1.json', 'r') as file:
+            expected_body = json.load(file)
+
+        with open('resources/event-api-gateway-response.json', 'r') as file:
+            event_response = json.load(file)
+
+        event['queryStringParameters'] = dict(query=query)
+        expected_response = event_response
+        expected_response['body'] = json.dumps(expected_body)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+        from fetch_properties.core.mongodb import MONGODB_MARKET_CONNECTIONS
+
+        mongodb_database = MONGODB_CONNECTION.database
+        mongodb_collection = MONGODB_MARKET_CONNECTIONS['IT'].collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        self.assertEqual('properties_it', mongodb_collection)
+        self.assertDictEqual(expected_response, actual_response)
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventsAndScatterQueriesOverCachedTiles(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '100'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-1.json', 'r') as file:
+            properties_collection = json.load(file)
+
+        with open('resources/collection-3.json', 'r') as file:
+            statistics_collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-1.graphql', 'r') as file:
+            properties_query = ' '.join(file.readlines())
+
+        with open('resources/query-3.graphql', 'r') as file:
+            statistics_query = ' '.join(file.readlines())
+
+        with open('resources/response-body-1.json', 'r') as file:
+            expected_properties_body = json.load(file)
+
+        with open('resources/response-body-3.json', 'r') as file:
+            expected_statistics_body = json.load(file)
+
+        with open('resources/event-api-gateway-response.json', 'r') as file:
+            event_response = json.load(file)
+
+        expected_properties_response = event_response
+        expected_properties_response['body'] = json.dumps(expected_properties_body)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+        from fetch_properties.core.mongodb import DEFAULT_MARKET
+        from fetch_properties.core.schema.resolver import MongoDBResolver, MONGODB_CLIENT, RESOLVER_REGISTRY
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in properties_collection + statistics_collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(properties_collection)
+
+        resolver = MongoDBResolver(max_page_size=100, mongodb_client=MONGODB_CLIENT,
+                                   mongodb_connection=mongodb_connection, scatter_max_workers=4, tile_cache_size=64)
+
+        with mock.patch.dict(RESOLVER_REGISTRY.resolvers, {DEFAULT_MARKET: resolver}):
+            actual_responses = [
+                LAMBDA_HANDLER.run(event={**event, 'queryStringParameters': dict(query=properties_query)}, context=None)
+                for _ in range(2)
+            ]
+
+        for actual_response in actual_responses:
+            self.assertDictEqual(expected_properties_response, actual_response)
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].drop()
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(statistics_collection)
+        mock_mongodb_client[mongodb_database][mongodb_collection].create_index([('location.geohash', pymongo.ASCENDING)])
+
+        resolver = MongoDBResolver(max_page_size=100, mongodb_client=MONGODB_CLIENT,
+                                   mongodb_connection=mongodb_connection, scatter_max_workers=4, tile_cache_size=64)
+
+        with mock.patch.dict(RESOLVER_REGISTRY.resolvers, {DEFAULT_MARKET: resolver}):
+            actual_response = LAMBDA_HANDLER.run(
+                event={**event, 'queryStringParameters': dict(query=statistics_query)}, context=None
+            )
+
+        actual_body = json.loads(actual_response['body'])
+
+        statistics_filter = SimpleNamespace(
+            n_rooms=SimpleNamespace(min=2, max=5), surface=SimpleNamespace(min=40, max=200), condition='BEST'
+        )
+
+        self.assertEqual(32, len(resolver.get_scatter_predicates(filter=statistics_filter)))
+        self.assertCountEqual(actual_body['data']['statisticsByFilter']['localStatistics'], expected_statistics_body['data']['statisticsByFilter']['localStatistics'])
+        self.assertDictEqual(actual_body['data']['statisticsByFilter']['globalStatistics'], expected_statistics_body['data']['statisticsByFilter']['globalStatistics'])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveApiGatewayEventAndQueryStatisticsWithPrecomputedGeohashPrefixes(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-3.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-3.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        with open('resources/response-body-3.json', 'r') as file:
+            expected_body = json.load(file)
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+        from fetch_properties.core.mongodb import DEFAULT_MARKET
+        from fetch_properties.core.mongodb.migration import migrate
+        from fetch_properties.core.schema.resolver import MongoDBResolver, MONGODB_CLIENT, RESOLVER_REGISTRY
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        updated = migrate(collection=mock_mongodb_client[mongodb_database][mongodb_collection])
+
+        resolver = MongoDBResolver(max_page_size=2, mongodb_client=MONGODB_CLIENT,
+                                   mongodb_connection=mongodb_connection, precomputed_geohash_prefixes=True)
+
+        with mock.patch.dict(RESOLVER_REGISTRY.resolvers, {DEFAULT_MARKET: resolver}):
+            actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+
+        self.assertEqual(len(collection), updated)
+        self.assertEqual('statistics_geohash_7', resolver.get_statistics_query_plan(filter=SimpleNamespace(
+            n_rooms=SimpleNamespace(min=2, max=5), surface=SimpleNamespace(min=40, max=200), condition='BEST'
+        )).hint)
+        self.assertCountEqual(actual_body['data']['statisticsByFilter']['localStatistics'], expected_body['data']['statisticsByFilter']['localStatistics'])
+        self.assertDictEqual(actual_body['data']['statisticsByFilter']['globalStatistics'], expected_body['data']['statisticsByFilter']['globalStatistics'])
+
+        unmigrated_document = dict(collection[0], _id='unmigrated', cursor=bson.ObjectId())
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_one(unmigrated_document)
+
+        with mock.patch.dict(RESOLVER_REGISTRY.resolvers, {DEFAULT_MARKET: resolver}):
+            actual_response = LAMBDA_HANDLER.run(event=event, context=None)
+
+        actual_body = json.loads(actual_response['body'])
+
+        self.assertCountEqual(actual_body['data']['statisticsByFilter']['localStatistics'], expected_body['data']['statisticsByFilter']['localStatistics'])
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
+    def testRunWhenReceiveConcurrentApiGatewayEventsAndQueryStatistics(self):
+
+        mongodb_uri = MONGODB_CONTAINER.get_connection_url()
+        os.environ['MONGODB_URI'] = mongodb_uri
+        os.environ['MONGODB_MAX_PAGE_SIZE'] = '2'
+        os.environ['MONGODB_DATABASE'] = ''
+        os.environ['MONGODB_COLLECTION'] = ''
+
+        with open('resources/collection-3.json', 'r') as file:
+            collection = json.load(file)
+
+        with open('resources/event-api-gateway.json', 'r') as file:
+            event = json.load(file)
+
+        with open('resources/query-3.graphql', 'r') as file:
+            query = ' '.join(file.readlines())
+
+        with open('resources/response-body-3.json', 'r') as file:
+            expected_body = json.load(file)
+
+        event['queryStringParameters'] = dict(query=query)
+
+        from fetch_properties.core.handler import LAMBDA_HANDLER, MONGODB_CONNECTION
+        from fetch_properties.core.schema.resolver import SINGLE_FLIGHT
+
+        mongodb_connection = MONGODB_CONNECTION
+        mongodb_database = mongodb_connection.database
+        mongodb_collection = mongodb_connection.collection
+        mock_mongodb_client = pymongo.MongoClient(mongodb_uri)
+
+        for document in collection:
+            document['cursor'] = bson.ObjectId(oid=document['cursor'])
+
+        mock_mongodb_client[mongodb_database][mongodb_collection].insert_many(collection)
+
+        SINGLE_FLIGHT.collect()
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                actual_responses = list(executor.map(
+                    lambda _: LAMBDA_HANDLER.run(event=event, context=None), range(8)
+                ))
+
+        metrics = [json.loads(line) for line in stdout.getvalue().splitlines() if line.startswith('{"_aws"')]
+
+        for actual_response in actual_responses:
+            actual_body = json.loads(actual_response['body'])
+
+            self.assertCountEqual(actual_body['data']['statisticsByFilter']['localStatistics'], expected_body['data']['statisticsByFilter']['localStatistics'])
+            self.assertDictEqual(actual_body['data']['statisticsByFilter']['globalStatistics'], expected_body['data']['statisticsByFilter']['globalStatistics'])
+
+        self.assertEqual(0, len(SINGLE_FLIGHT.calls))
+        self.assertEqual(8, len(metrics))
+        self.assertEqual(8, sum(metric['SingleFlightExecuted'] + metric['SingleFlightCoalesced'] for metric in metrics))
+        self.assertEqual((0, 0), SINGLE_FLIGHT.collect())
+
+        mock_mongodb_client.drop_database(mongodb_database)
+
     @classmethod
     def tearDownClass(cls) -> None:
 
@@ -0,0 +1,47 @@
+import json
+import os
+import unittest
+
+
+class TestMetrics(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testFormatEmbeddedMetrics(self):
+
+        from fetch_properties.core.metrics import format_embedded_metrics
+
+        record = format_embedded_metrics(
+            namespace='FetchProperties',
+            metrics=dict(SingleFlightExecuted=3, SingleFlightCoalesced=5),
+            timestamp=1_600_000_000.5
+        )
+
+        self.assertNotIn('\n', record)
+        self.assertDictEqual(
+            {
+                "_aws": {
+                    "Timestamp": 1_600_000_000_500,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": 'FetchProperties',
+                            "Dimensions": [[]],
+                            "Metrics": [
+                                dict(Name='SingleFlightExecuted', Unit='Count'),
+                                dict(Name='SingleFlightCoalesced', Unit='Count')
+                            ]
+                        }
+                    ]
+                },
+                "SingleFlightExecuted": 3,
+                "SingleFlightCoalesced": 5
+            },
+            json.loads(record)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import os
+import unittest
+
+
+class TestMongoDB(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testGetGeohashPrefixesWhenGeohashIsComplete(self):
+
+        from fetch_properties.core.mongodb import get_geohash_prefixes
+
+        self.assertDictEqual(
+            dict(geohash_5='u0j2w', geohash_6='u0j2w6', geohash_7='u0j2w6u'),
+            get_geohash_prefixes(geohash='u0j2w6umh')
+        )
+
+    def testGetGeohashPrefixFieldWhenPrecisionIsSupported(self):
+
+        from fetch_properties.core.mongodb import GEOHASH_PREFIX_PRECISIONS, get_geohash_prefix_field
+
+        self.assertEqual(
+            ['location.geohash_5', 'location.geohash_6', 'location.geohash_7'],
+            [get_geohash_prefix_field(precision=precision) for precision in GEOHASH_PREFIX_PRECISIONS]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import unittest
+from types import SimpleNamespace
+
+from .mock_mongodb import MockCollection
+
+
+FILTER = SimpleNamespace(
+    n_rooms=SimpleNamespace(min=2, max=5),
+    surface=SimpleNamespace(min=40, max=None),
+    condition='BEST'
+)
+
+GEO_WITHIN_PREDICATES = {
+    "location.point": {
+        "$geoWithin": {
+            "$box": [[7.0, 45.0], [8.0, 46.0]]
+        }
+    }
+}
+
+
+class TestQueryPlanner(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testPlanWhenFilterIsServedByIndex(self):
+
+        from fetch_properties.core.schema.planner import QueryPlanner
+
+        query_planner = QueryPlanner(indexes={
+            'condition': [('condition', 1), ('published_on', -1), ('n_rooms', 1), ('surface', 1)]
+        })
+        query_plan = query_planner.plan(filter=FILTER, sort=['published_on'])
+
+        self.assertEqual('condition', query_plan.hint)
+        self.assertEqual(['condition', 'n_rooms', 'surface'], list(query_plan.match.keys()))
+        self.assertDictEqual({"$gte": 40}, query_plan.match['surface'])
+
+    def testPlanWhenGeoWithinPredicateIsNotCoveredByIndex(self):
+
+        from fetch_properties.core.schema.planner import QueryPlanner
+
+        query_planner = QueryPlanner(indexes={
+            'condition': [('condition', 1), ('published_on', -1), ('n_rooms', 1), ('surface', 1)],
+            'location': [('location.point', '2dsphere')]
+        })
+        query_plan = query_planner.plan(filter=FILTER, predicates=GEO_WITHIN_PREDICATES, sort=['published_on'])
+
+        self.assertIsNone(query_plan.hint)
+        self.assertDictEqual({}, query_plan.options)
+        self.assertIn('location.point', query_plan.match)
+
+    def testGetIndexesWhenIndexesAreSparseOrPartial(self):
+
+        from fetch_properties.core.mongodb import MongoDBConnection
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        collection = MockCollection(indexes={
+            '_id_': dict(key=[('_id', 1)]),
+            'condition': dict(key=[('condition', 1)]),
+            'condition_sparse': dict(key=[('condition', 1), ('n_rooms', 1)], sparse=True),
+            'condition_partial': dict(key=[('condition', 1), ('n_rooms', 1), ('surface', 1)],
+                                      partialFilterExpression={'price': {'$gt': 0}})
+        })
+        resolver = MongoDBResolver(
+            max_page_size=2,
+            mongodb_client=dict(database=dict(properties=collection)),
+            mongodb_connection=MongoDBConnection(uri=None, database='database', collection='properties')
+        )
+
+        self.assertCountEqual(['_id_', 'condition'], resolver.get_indexes().keys())
+        self.assertEqual('condition', resolver.get_query_plan(filter=FILTER).hint)
+
+    def testAggregateWhenHintedIndexHasBeenDropped(self):
+
+        from fetch_properties.core.mongodb import MongoDBConnection
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        collection = MockCollection(indexes={
+            'condition': dict(key=[('condition', 1)]),
+            'condition_n_rooms': dict(key=[('condition', 1), ('n_rooms', 1)])
+        })
+        resolver = MongoDBResolver(
+            max_page_size=2,
+            mongodb_client=dict(database=dict(properties=collection)),
+            mongodb_connection=MongoDBConnection(uri=None, database='database', collection='properties')
+        )
+
+        self.assertEqual('condition_n_rooms', resolver.get_query_plan(filter=FILTER).hint)
+
+        collection.dropped_indexes.append('condition_n_rooms')
+        resolver.aggregate_local_statistics(filter=FILTER, statistics={'min'})
+
+        self.assertEqual(['condition_n_rooms', 'condition'], collection.hints)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import csv
+import io
+import os
+import unittest
+from types import SimpleNamespace
+
+from .mock_mongodb import MockCollection
+
+
+PROPERTIES = [
+    dict(cursor='5ffc13f406610351150ae45a', price=135000,
+         location=dict(point=dict(type='Point', coordinates=[7.6634925, 45.1038648]), geohash='u0j2w6umh')),
+    dict(cursor='5ffc13f406610351150ae45b', price=None,
+         location=dict(point=dict(type='Point', coordinates=[7.34602, 45.0519856]), geohash='u0j0r1mny'))
+]
+
+
+class TestPropertiesExporter(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testExportWhenFormatIsCsvAndFilterIsPartial(self):
+
+        from fetch_properties.core.export import PropertiesExporter
+        from fetch_properties.core.mongodb import MongoDBConnection
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+        from fetch_properties.core.schema.tiles import Box
+
+        collection = MockCollection(
+            indexes={'condition': dict(key=[('condition', 1), ('n_rooms', 1)])},
+            results=lambda pipeline: PROPERTIES
+        )
+        resolver = MongoDBResolver(
+            max_page_size=2,
+            mongodb_client=dict(database=dict(properties=collection)),
+            mongodb_connection=MongoDBConnection(uri=None, database='database', collection='properties')
+        )
+        box = Box(min_latitude=44.0567, min_longitude=5.3846, max_latitude=46.1102, max_longitude=9.9208)
+        filter = SimpleNamespace(n_rooms=SimpleNamespace(min=2, max=None), surface=None, condition='BEST')
+        sink = io.StringIO()
+
+        count = PropertiesExporter(resolver=resolver, batch_size=500).export(
+            sink=sink, box=box, filter=filter, format='csv'
+        )
+
+        self.assertEqual(2, count)
+        self.assertEqual(
+            'id,price,latitude,longitude,geohash\r\n'
+            '5ffc13f406610351150ae45a,135000,45.1038648,7.6634925,u0j2w6umh\r\n'
+            '5ffc13f406610351150ae45b,,45.0519856,7.34602,u0j0r1mny\r\n',
+            sink.getvalue()
+        )
+        self.assertEqual(2, len(list(csv.DictReader(io.StringIO(sink.getvalue())))))
+        self.assertDictEqual(
+            {
+                "condition": 'BEST',
+                "n_rooms": {"$gte": 2},
+                "location.point": {"$geoWithin": {"$box": box.to_mongodb_box()}}
+            },
+            collection.pipelines[0][0]['$match']
+        )
+        self.assertNotIn('$limit', str(collection.pipelines[0]))
+        self.assertDictEqual(dict(batchSize=500), collection.options[0])
+
+    def testExportWhenFormatIsUnsupported(self):
+
+        from fetch_properties.core.export import PropertiesExporter
+
+        with self.assertRaises(ValueError):
+            PropertiesExporter(resolver=None).export(sink=io.StringIO(), box=None, format='xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
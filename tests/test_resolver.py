@@ -0,0 +1,560 @@
+import bson
+import copy
+import os
+import pygeohash
+import random
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from .mock_mongodb import MockCollection
+
+
+FILTER = SimpleNamespace(
+    n_rooms=SimpleNamespace(min=2, max=5),
+    surface=SimpleNamespace(min=40, max=200),
+    condition='BEST'
+)
+
+FIRST_PAGE = '000000000000000000000000'
+
+BOUNDING_BOX = '{bottomLeft: {latitude: 45.0, longitude: 7.0}, topRight: {latitude: 46.0, longitude: 8.0}}'
+
+STATISTICS_INDEX = [
+    ('condition', 1), ('published_on', -1), ('n_rooms', 1), ('surface', 1), ('location.geohash_7', 1), ('price', 1)
+]
+
+
+def create_resolver(collection, **parameters):
+
+    from fetch_properties.core.mongodb import MongoDBConnection
+    from fetch_properties.core.schema.resolver import MongoDBResolver
+
+    return MongoDBResolver(
+        max_page_size=2,
+        mongodb_client=dict(database=dict(properties=collection)),
+        mongodb_connection=MongoDBConnection(uri=None, database='database', collection='properties'),
+        **parameters
+    )
+
+
+def create_properties(count, randomizer):
+
+    properties = []
+    for index in range(count):
+        latitude = 45.0 + randomizer.random() * 0.5
+        longitude = 7.0 + randomizer.random() * 0.5
+        properties.append(dict(
+            cursor=bson.ObjectId(),
+            price=randomizer.randint(50_000, 500_000),
+            published_on=f'2021-{1 + index // 1440:04d}-{index // 60 % 24:02d}T{index % 60:02d}',
+            location=dict(
+                point=dict(type='Point', coordinates=[longitude, latitude]),
+                geohash=pygeohash.encode(latitude=latitude, longitude=longitude, precision=12)
+            )
+        ))
+
+    return properties
+
+
+def find_properties(properties, pipeline):
+    """Answers the properties aggregation of a bounding box in memory, or of the tiles of a bounding box"""
+
+    match = pipeline[0]['$match']
+    (min_longitude, min_latitude), (max_longitude, max_latitude) = match['location.point']['$geoWithin']['$box']
+
+    results = sorted(
+        (
+            property for property in properties
+            if min_longitude <= property['location']['point']['coordinates'][0] <= max_longitude
+            and min_latitude <= property['location']['point']['coordinates'][1] <= max_latitude
+            and property['cursor'] > match['cursor']['$gt']
+        ),
+        key=lambda property: property['published_on'],
+        reverse=True
+    )
+
+    group = next((stage['$group'] for stage in pipeline if '$group' in stage), None)
+    if group is None:
+        return results[:next(stage['$limit'] for stage in pipeline if '$limit' in stage)]
+
+    precision = group['_id']['$substr'][2]
+    tiles = {}
+    for property in results:
+        tiles.setdefault(property['location']['geohash'][:precision], []).append(property)
+
+    return [
+        dict(_id=tile, properties=tile_properties[:group['properties']['$topN']['n']])
+        for tile, tile_properties in tiles.items()
+    ]
+
+
+def execute(query, resolver):
+    """Runs a GraphQL query against the schema, every market being served by the given resolver"""
+
+    import graphene
+
+    from fetch_properties.core.schema.query import MongoDBQuery
+    from fetch_properties.core.schema.resolver import RESOLVER_REGISTRY
+
+    with mock.patch.object(RESOLVER_REGISTRY, 'get', return_value=resolver):
+        return graphene.Schema(query=MongoDBQuery).execute(query)
+
+
+class TestMongoDBResolver(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testGetPercentileWhenPercentileFallsInOpenLastBucket(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        percentile = MongoDBResolver.get_percentile(
+            histogram=[0, 0, 2], boundaries=[0, 100, 200], percentile=0.5, min_price=250, max_price=450
+        )
+
+        self.assertEqual(350, percentile)
+
+    def testGetPercentileWhenBucketIsWiderThanPrices(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        percentiles = [
+            MongoDBResolver.get_percentile(
+                histogram=[2, 0, 0], boundaries=[0, 100, 200], percentile=percentile, min_price=20, max_price=60
+            ) for percentile in (0.0, 0.5, 1.0)
+        ]
+
+        self.assertEqual([20, 40, 60], percentiles)
+
+    def testGetPercentileWhenThereAreNoPrices(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        self.assertIsNone(MongoDBResolver.get_percentile(
+            histogram=[0, 0, 0], boundaries=[0, 100, 200], percentile=0.5, min_price=None, max_price=None
+        ))
+
+    def testGetScatterPredicatesWhenGeohashPrefixIsNotIndexed(self):
+
+        collection = MockCollection(indexes={
+            'condition': dict(key=[('condition', 1), ('published_on', -1), ('n_rooms', 1), ('surface', 1)])
+        })
+        resolver = create_resolver(collection=collection, scatter_max_workers=4)
+
+        self.assertEqual([], resolver.get_scatter_predicates(filter=FILTER))
+        self.assertEqual([], collection.pipelines)
+
+    def testGetScatterPredicatesWhenGeohashPrefixIsIndexed(self):
+
+        from fetch_properties.core.schema.resolver import MAX_COLLECTION_SIZE
+
+        collection = MockCollection(
+            indexes={'statistics_geohash_7': dict(key=STATISTICS_INDEX)},
+            results=lambda pipeline: [dict(published_on='2021-01-11')]
+        )
+        resolver = create_resolver(collection=collection, scatter_max_workers=4, precomputed_geohash_prefixes=True)
+
+        scatter_predicates = resolver.get_scatter_predicates(filter=FILTER)
+        pipeline, query_plan = resolver.get_statistics_pipeline(
+            filter=FILTER, statistics={'min'}, by_geohash=True, predicates=scatter_predicates[0]
+        )
+
+        self.assertEqual(32, len(scatter_predicates))
+        self.assertDictEqual(
+            {"location.geohash_7": {"$regex": "^0"}, "published_on": {"$gte": '2021-01-11'}},
+            scatter_predicates[0]
+        )
+        self.assertIn({"$skip": MAX_COLLECTION_SIZE - 1}, collection.pipelines[0])
+        self.assertEqual('statistics_geohash_7', query_plan.hint)
+        self.assertNotIn({"$limit": MAX_COLLECTION_SIZE}, pipeline)
+
+    def testGetScatterPredicatesWhenFewerPropertiesThanCollectionSizeMatch(self):
+
+        collection = MockCollection(indexes={'geohash': dict(key=[('location.geohash', 1)])})
+        resolver = create_resolver(collection=collection, scatter_max_workers=4)
+
+        scatter_predicates = resolver.get_scatter_predicates(filter=FILTER)
+
+        self.assertEqual(32, len(scatter_predicates))
+        self.assertDictEqual({"location.geohash": {"$regex": "^0"}}, scatter_predicates[0])
+
+    def testFindStatisticsByFilterWhenPercentilesAreScattered(self):
+
+        collection = MockCollection(indexes={'geohash': dict(key=[('location.geohash', 1)])})
+        resolver = create_resolver(collection=collection, scatter_max_workers=4)
+        resolver.server_version = (7, 0)
+
+        resolver.find_statistics_by_filter(
+            filter=FILTER,
+            fields={'global_statistics', 'global_statistics.price', 'global_statistics.price.median'}
+        )
+
+        self.assertEqual(2, len(collection.pipelines))
+        self.assertIn('price_percentiles', collection.pipelines[1][-2]['$group'])
+
+    def testFindStatisticsByFilterWhenAveragesAreScattered(self):
+
+        collection = MockCollection(indexes={'geohash': dict(key=[('location.geohash', 1)])})
+        resolver = create_resolver(collection=collection, scatter_max_workers=4)
+
+        resolver.find_statistics_by_filter(
+            filter=FILTER,
+            fields={'global_statistics', 'global_statistics.price', 'global_statistics.price.avg'}
+        )
+
+        self.assertEqual(1 + 32, len(collection.pipelines))
+        self.assertIn('price_sum', collection.pipelines[1][-2]['$group'])
+
+    def testGetScatterBoxesWhenBoxIsSmall(self):
+
+        from fetch_properties.core.schema.tiles import Box
+
+        resolver = create_resolver(collection=None, scatter_max_workers=4)
+        box = Box(min_latitude=45.0, min_longitude=7.6, max_latitude=45.05, max_longitude=7.7)
+
+        self.assertEqual([box], resolver.get_scatter_boxes(box=box))
+
+    def testGetScatterBoxesWhenBoxIsWide(self):
+
+        from fetch_properties.core.schema.tiles import Box
+
+        resolver = create_resolver(collection=None, scatter_max_workers=4)
+
+        self.assertEqual(16, len(resolver.get_scatter_boxes(
+            box=Box(min_latitude=36.6, min_longitude=6.6, max_latitude=47.1, max_longitude=18.5)
+        )))
+        self.assertEqual(16, len(resolver.get_scatter_boxes(
+            box=Box(min_latitude=0.0, min_longitude=0.0, max_latitude=40.0, max_longitude=40.0)
+        )))
+
+    def testFindPropertiesByBoundingBoxAndFilterWhenBoxIsScattered(self):
+
+        properties = create_properties(count=200, randomizer=random.Random(42))
+        collection = MockCollection(indexes={}, results=lambda pipeline: find_properties(properties, pipeline))
+        resolver = create_resolver(collection=collection, scatter_max_workers=4, scatter_min_span=0.1)
+        resolver.max_page_size = 10
+        bounding_box = SimpleNamespace(
+            bottom_left=SimpleNamespace(latitude=45.05, longitude=7.05),
+            top_right=SimpleNamespace(latitude=45.45, longitude=7.45)
+        )
+
+        properties_page = resolver.find_properties_by_bounding_box_and_filter(
+            bounding_box=bounding_box, filter=None, page=''
+        )
+        resolver.scatter_max_workers = 1
+        expected = resolver.find_properties_by_bounding_box_and_filter(bounding_box=bounding_box, filter=None, page='')
+
+        self.assertEqual(1 + 16, len(collection.pipelines))
+        self.assertEqual([result.id for result in expected.properties],
+                         [result.id for result in properties_page.properties])
+
+    def testMergePropertiesWhenTilesOverlap(self):
+
+        resolver = create_resolver(collection=None)
+        resolver.max_page_size = 3
+
+        properties = resolver.merge_properties(tile_results=[
+            [dict(cursor='a', published_on='2021-01-13'), dict(cursor='c', published_on='2021-01-10')],
+            [dict(cursor='b', published_on='2021-01-12'), dict(cursor='a', published_on='2021-01-13')],
+            [],
+            [dict(cursor='d', published_on='2021-01-11'), dict(cursor='e', published_on='2021-01-09')]
+        ])
+
+        self.assertEqual(['a', 'b', 'd'], [result['cursor'] for result in properties])
+
+    def testMergePropertiesWhenTilesHoldLessThanPage(self):
+
+        resolver = create_resolver(collection=None)
+
+        properties = resolver.merge_properties(tile_results=[
+            [dict(cursor='a', published_on='2021-01-11')],
+            [dict(cursor='b', published_on=None)]
+        ])
+
+        self.assertEqual(['a', 'b'], [result['cursor'] for result in properties])
+
+    def testMergePricesWhenSomeSlicesAreEmpty(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        merged = MongoDBResolver.merge_prices(prices=[
+            None,
+            dict(min=100, max=300, sum=400, count=2, histogram=[0, 1, 1]),
+            dict(min=None, max=None, sum=0, count=0, histogram=[0, 0, 0]),
+            dict(min=50, max=50, sum=50, count=1, histogram=[1, 0, 0])
+        ])
+
+        self.assertDictEqual(dict(min=50, max=300, avg=150, histogram=[1, 1, 1]), merged)
+
+    def testMergePricesWhenEverySliceIsEmpty(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        self.assertIsNone(MongoDBResolver.merge_prices(prices=[]))
+        self.assertIsNone(MongoDBResolver.merge_prices(prices=[None, None]))
+        self.assertDictEqual(
+            dict(min=None, max=None, avg=None),
+            MongoDBResolver.merge_prices(prices=[dict(min=None, max=None, sum=0, count=0)])
+        )
+
+    def testFindPropertiesInCachedTilesWhenBoxIsPanned(self):
+
+        from fetch_properties.core.schema.tiles import Box
+
+        properties = create_properties(count=2_000, randomizer=random.Random(42))
+
+        for server_version, tile_cache_max_tiles in (((7, 0), 64), ((5, 0), 64), ((7, 0), 4)):
+            collection = MockCollection(indexes={}, results=lambda pipeline: find_properties(properties, pipeline))
+            resolver = create_resolver(
+                collection=collection, tile_cache_size=256, tile_cache_max_tiles=tile_cache_max_tiles
+            )
+            resolver.max_page_size = 20
+            resolver.server_version = server_version
+
+            for pan in range(10):
+                box = Box(
+                    min_latitude=45.1 + pan * 0.01,
+                    min_longitude=7.1 + pan * 0.02,
+                    max_latitude=45.2 + pan * 0.01,
+                    max_longitude=7.3 + pan * 0.02
+                )
+                expected = resolver.aggregate_properties(box=box, filter=None, page=FIRST_PAGE, fields=None)
+
+                actual = resolver.find_properties_in_cached_tiles(box=box, filter=None, page=FIRST_PAGE)
+                with mock.patch.object(resolver.tile_cache, 'put', wraps=resolver.tile_cache.put) as put:
+                    cached = resolver.find_properties_in_cached_tiles(box=box, filter=None, page=FIRST_PAGE)
+
+                self.assertEqual([result['cursor'] for result in expected], [result['cursor'] for result in actual])
+                self.assertEqual([result['cursor'] for result in actual], [result['cursor'] for result in cached])
+                self.assertEqual(0, put.call_count)
+
+    def testFindPropertiesInCachedTilesWhenDenseBoxIsPannedInSmallSteps(self):
+
+        from fetch_properties.core.schema.tiles import Box
+
+        properties = create_properties(count=20_000, randomizer=random.Random(42))
+        collection = MockCollection(indexes={}, results=lambda pipeline: find_properties(properties, pipeline))
+        resolver = create_resolver(collection=collection, tile_cache_size=256)
+        resolver.max_page_size = 100
+        resolver.server_version = (7, 0)
+        pans = 20
+
+        aggregations = []
+        for pan in range(pans):
+            box = Box(
+                min_latitude=45.1 + pan * 0.005,
+                min_longitude=7.1 + pan * 0.005,
+                max_latitude=45.15 + pan * 0.005,
+                max_longitude=7.2 + pan * 0.005
+            )
+            expected = resolver.aggregate_properties(box=box, filter=None, page=FIRST_PAGE, fields=None)
+
+            before = len(collection.pipelines)
+            actual = resolver.find_properties_in_cached_tiles(box=box, filter=None, page=FIRST_PAGE)
+            aggregations.append(len(collection.pipelines) - before)
+
+            self.assertEqual([result['cursor'] for result in expected], [result['cursor'] for result in actual])
+
+        self.assertEqual(1, aggregations[0])
+        self.assertLess(sum(aggregations[1:]), (pans - 1) / 2)
+
+    def testFindPropertiesNearPointWhenLimitIsNotPositive(self):
+
+        collection = MockCollection(indexes={})
+        resolver = create_resolver(collection=collection)
+        point = SimpleNamespace(latitude=45.1038648, longitude=7.6634925)
+
+        self.assertEqual([], resolver.find_properties_near_point(point=point, filter=None, limit=0))
+        self.assertEqual([], resolver.find_properties_within_radius(point=point, radius=100, filter=None, limit=-1))
+        self.assertEqual([], collection.pipelines)
+
+    def testFindPropertiesWithinRadiusWhenRadiusIsNegative(self):
+
+        collection = MockCollection(indexes={})
+        resolver = create_resolver(collection=collection)
+        point = SimpleNamespace(latitude=45.1038648, longitude=7.6634925)
+
+        with self.assertRaises(ValueError):
+            resolver.find_properties_within_radius(point=point, radius=-1, filter=None)
+
+        self.assertEqual([], collection.pipelines)
+
+    def testGetSelectedFieldsWhenQueryUsesFragmentsAndAliases(self):
+
+        resolver = mock.Mock()
+        resolver.find_properties_by_bounding_box_and_filter.return_value = None
+
+        result = execute(
+            '''
+            query {
+                page: propertiesByBoundingBoxAndFilter(
+                    boundingBox: %s
+                ) {
+                    __typename
+                    properties {
+                        ...PropertyPrice
+                        ... on Property {
+                            position: location { latitude }
+                        }
+                    }
+                }
+            }
+
+            fragment PropertyPrice on Property {
+                price
+            }
+            ''' % BOUNDING_BOX,
+            resolver=resolver
+        )
+
+        self.assertIsNone(result.errors)
+        self.assertSetEqual(
+            {'properties', 'properties.price', 'properties.location', 'properties.location.latitude'},
+            resolver.find_properties_by_bounding_box_and_filter.call_args.kwargs['fields']
+        )
+
+    def testFindPropertiesByBoundingBoxAndFilterWhenFewFieldsAreSelected(self):
+
+        collection = MockCollection(
+            indexes={},
+            results=lambda pipeline: [dict(cursor=bson.ObjectId(), price=100_000)]
+        )
+        resolver = create_resolver(collection=collection)
+
+        for selection, projection in (
+                ('page', {"_id": 0, "cursor": 1}),
+                ('properties { price }', {"_id": 0, "cursor": 1, "price": 1}),
+                ('properties { location { longitude } }', {"_id": 0, "cursor": 1, "location.point": 1}),
+                ('properties { id location { geohash } }', {"_id": 0, "cursor": 1, "location.geohash": 1})
+        ):
+            result = execute(
+                '''
+                {
+                    propertiesByBoundingBoxAndFilter(
+                        boundingBox: %s
+                    ) { %s }
+                }
+                ''' % (BOUNDING_BOX, selection),
+                resolver=resolver
+            )
+
+            self.assertIsNone(result.errors)
+            self.assertDictEqual(projection, collection.pipelines[-1][2]['$project'])
+
+    def testFindStatisticsByFilterWhenOnlyGeohashAndAverageAreSelected(self):
+
+        from fetch_properties.core.schema.resolver import MongoDBResolver
+
+        collection = MockCollection(
+            indexes={},
+            results=lambda pipeline: [dict(geohash='u0j2w0p', price=dict(avg=100_000))]
+        )
+        resolver = create_resolver(collection=collection)
+
+        with mock.patch.object(MongoDBResolver, 'get_bounding_box') as get_bounding_box, \
+                mock.patch.object(MongoDBResolver, 'get_score') as get_score:
+            result = execute(
+                '{ statisticsByFilter { localStatistics { geohash price { avg } } } }',
+                resolver=resolver
+            )
+
+        self.assertIsNone(result.errors)
+        self.assertEqual(
+            [dict(geohash='u0j2w0p', price=dict(avg=100_000))],
+            result.data['statisticsByFilter']['localStatistics']
+        )
+        self.assertEqual(1, len(collection.pipelines))
+        self.assertDictEqual(
+            {"_id": {"$substr": ["$location.geohash", 0, 7]}, "price_avg": {"$avg": "$price"}},
+            collection.pipelines[0][-2]['$group']
+        )
+        self.assertEqual(0, get_bounding_box.call_count)
+        self.assertEqual(0, get_score.call_count)
+
+    def testFindStatisticsByFilterWhenScoreIsSelected(self):
+
+        collection = MockCollection(
+            indexes={},
+            results=lambda pipeline: [dict(geohash='u0j2w0p', price=dict(avg=100_000))]
+        )
+        resolver = create_resolver(collection=collection)
+
+        result = execute('{ statisticsByFilter { localStatistics { score } } }', resolver=resolver)
+
+        self.assertIsNone(result.errors)
+        self.assertEqual([dict(score=50)], result.data['statisticsByFilter']['localStatistics'])
+        self.assertEqual(2, len(collection.pipelines))
+        self.assertDictEqual(
+            {"_id": None, "price_avg": {"$avg": "$price"}},
+            collection.pipelines[0][-2]['$group']
+        )
+
+    def testGetKeyWhenArgumentsAreEquivalent(self):
+
+        import graphene
+
+        from fetch_properties.core.schema.query import MongoDBQuery
+        from fetch_properties.core.schema.resolver import RESOLVER_REGISTRY, SingleFlightResolver
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        keys = []
+        single_flight.do = lambda key, function: keys.append(key)
+        resolver = SingleFlightResolver(resolver=create_resolver(collection=None), single_flight=single_flight)
+        graphql_schema = graphene.Schema(query=MongoDBQuery)
+
+        with mock.patch.object(RESOLVER_REGISTRY, 'get', return_value=resolver):
+            for filter in ('{nRooms: {min: 2, max: null}}', '{nRooms: {min: 2}, condition: null}', '{}',
+                           '{condition: "BEST"}'):
+                result = graphql_schema.execute(
+                    f'{{ statisticsByFilter(filter: {filter}) {{ globalStatistics {{ price {{ min }} }} }} }}'
+                )
+                self.assertIsNone(result.errors)
+
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(keys[2], resolver.get_key(
+            'statistics_by_filter',
+            filter=None,
+            fields={'global_statistics', 'global_statistics.price', 'global_statistics.price.min'}
+        ))
+        self.assertNotEqual(keys[2], keys[3])
+        self.assertEqual(resolver.get_limit(limit=None), resolver.get_limit(limit=100))
+
+    def testFindPropertiesByBoundingBoxAndFilterWhenPagesAreEquivalent(self):
+
+        from fetch_properties.core.schema.resolver import SingleFlightResolver
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        keys = []
+        single_flight.do = lambda key, function: keys.append(key)
+        resolver = SingleFlightResolver(resolver=create_resolver(collection=None), single_flight=single_flight)
+        bounding_box = SimpleNamespace(
+            bottom_left=SimpleNamespace(latitude=44.0567, longitude=5.3846),
+            top_right=SimpleNamespace(latitude=46.1102, longitude=9.9208)
+        )
+
+        for page in ('', '000000000000000000000000'):
+            resolver.find_properties_by_bounding_box_and_filter(bounding_box=bounding_box, filter=None, page=page)
+
+        self.assertEqual(keys[0], keys[1])
+
+    def testGetAttributeWhenResolverIsCopied(self):
+
+        from fetch_properties.core.schema.resolver import SingleFlightResolver
+        from fetch_properties.core.singleflight import SingleFlight
+
+        resolver = SingleFlightResolver(resolver=create_resolver(collection=None), single_flight=SingleFlight())
+        copied = copy.copy(resolver)
+
+        self.assertIs(resolver.resolver, copied.resolver)
+        self.assertEqual('properties', copied.mongodb_connection.collection)
+        self.assertFalse(hasattr(SingleFlightResolver.__new__(SingleFlightResolver), 'mongodb_connection'))
+
+
+if __name__ == '__main__':
+    unittest.main()
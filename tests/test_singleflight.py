@@ -0,0 +1,169 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+
+FOLLOWERS = 7
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def wait_until(self, condition):
+
+        deadline = time.monotonic() + 10
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def testDoWhenCallsAreConcurrent(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        result = object()
+
+        def function():
+            started.set()
+            release.wait(timeout=10)
+            return result
+
+        with ThreadPoolExecutor(max_workers=1 + FOLLOWERS) as executor:
+            leader = executor.submit(single_flight.do, 'key', function)
+            self.assertTrue(started.wait(timeout=10))
+            followers = [executor.submit(single_flight.do, 'key', function) for _ in range(FOLLOWERS)]
+            self.wait_until(lambda: single_flight.coalesced == FOLLOWERS)
+            release.set()
+            results = [future.result(timeout=10) for future in [leader] + followers]
+
+        self.assertEqual(1, single_flight.executed)
+        self.assertEqual(FOLLOWERS, single_flight.coalesced)
+        self.assertTrue(all(actual is result for actual in results))
+        self.assertDictEqual({}, single_flight.calls)
+
+    def testDoWhenFunctionRaises(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        exception = ValueError('hint provided does not correspond to an existing index')
+
+        def function():
+            started.set()
+            release.wait(timeout=10)
+            raise exception
+
+        with ThreadPoolExecutor(max_workers=1 + FOLLOWERS) as executor:
+            leader = executor.submit(single_flight.do, 'key', function)
+            self.assertTrue(started.wait(timeout=10))
+            followers = [executor.submit(single_flight.do, 'key', function) for _ in range(FOLLOWERS)]
+            self.wait_until(lambda: single_flight.coalesced == FOLLOWERS)
+            release.set()
+            exceptions = [future.exception(timeout=10) for future in [leader] + followers]
+
+        self.assertEqual(1, single_flight.executed)
+        self.assertTrue(all(actual is exception for actual in exceptions))
+        self.assertDictEqual({}, single_flight.calls)
+        self.assertEqual(1, single_flight.do('key', lambda: 1))
+        self.assertEqual(2, single_flight.executed)
+
+    def testDoWhenKeysDiffer(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+
+        self.assertEqual([1, 2], [single_flight.do('key-1', lambda: 1), single_flight.do('key-2', lambda: 2)])
+        self.assertEqual(2, single_flight.executed)
+        self.assertEqual(0, single_flight.coalesced)
+
+    def testDoAsyncWhenCoroutinesAreConcurrent(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        result = object()
+
+        def function():
+            started.set()
+            release.wait(timeout=10)
+            return result
+
+        async def run():
+            leader = asyncio.ensure_future(single_flight.do_async('key', function))
+            self.assertTrue(await asyncio.get_running_loop().run_in_executor(None, started.wait, 10))
+            followers = [asyncio.ensure_future(single_flight.do_async('key', function)) for _ in range(FOLLOWERS)]
+            await asyncio.sleep(0)
+            self.assertEqual(FOLLOWERS, single_flight.coalesced)
+            release.set()
+            return await asyncio.gather(leader, *followers)
+
+        results = asyncio.run(run())
+
+        self.assertEqual(1, single_flight.executed)
+        self.assertTrue(all(actual is result for actual in results))
+        self.assertDictEqual({}, single_flight.calls)
+
+    def testDoAsyncWhenThreadLeadsAndFunctionRaises(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        exception = ValueError('hint provided does not correspond to an existing index')
+
+        def function():
+            started.set()
+            release.wait(timeout=10)
+            raise exception
+
+        async def follow():
+            follower = asyncio.ensure_future(single_flight.do_async('key', function))
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(follower, return_exceptions=True)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            leader = executor.submit(single_flight.do, 'key', function)
+            self.assertTrue(started.wait(timeout=10))
+            results = asyncio.run(follow())
+
+            self.assertIs(exception, leader.exception(timeout=10))
+
+        self.assertEqual([exception], results)
+        self.assertEqual((1, 1), (single_flight.executed, single_flight.coalesced))
+        self.assertDictEqual({}, single_flight.calls)
+
+    def testCollectWhenCallsAreCollectedTwice(self):
+
+        from fetch_properties.core.singleflight import SingleFlight
+
+        single_flight = SingleFlight()
+        single_flight.do('key-1', lambda: 1)
+        single_flight.coalesced += 2
+
+        self.assertEqual((1, 2), single_flight.collect())
+        self.assertEqual((0, 0), single_flight.collect())
+
+        single_flight.do('key-2', lambda: 2)
+
+        self.assertEqual((1, 0), single_flight.collect())
+        self.assertEqual((2, 2), (single_flight.executed, single_flight.coalesced))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+from unittest import mock
+
+
+class TestTileCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testGetWhenEntryHasExpired(self):
+
+        from fetch_properties.core.cache import TileCache
+
+        tile_cache = TileCache(max_size=4, ttl=60.0)
+        with mock.patch('fetch_properties.core.cache.time.monotonic', return_value=1000.0):
+            tile_cache.put('u0j2', [1])
+        with mock.patch('fetch_properties.core.cache.time.monotonic', return_value=1059.0):
+            self.assertEqual((True, [1]), tile_cache.get('u0j2'))
+        with mock.patch('fetch_properties.core.cache.time.monotonic', return_value=1061.0):
+            self.assertEqual((False, None), tile_cache.get('u0j2'))
+
+        self.assertEqual(0, len(tile_cache.entries))
+
+    def testPutWhenCacheIsFull(self):
+
+        from fetch_properties.core.cache import TileCache
+
+        tile_cache = TileCache(max_size=2, ttl=60.0)
+        tile_cache.put('u0j0', 0)
+        tile_cache.put('u0j1', 1)
+        tile_cache.get('u0j0')
+        tile_cache.put('u0j2', 2)
+
+        self.assertEqual((True, 0), tile_cache.get('u0j0'))
+        self.assertEqual((False, None), tile_cache.get('u0j1'))
+        self.assertEqual((True, 2), tile_cache.get('u0j2'))
+
+    def testGetWhenValueIsEmpty(self):
+
+        from fetch_properties.core.cache import TileCache
+
+        tile_cache = TileCache(max_size=2, ttl=60.0)
+        tile_cache.put('u0j0', None)
+
+        self.assertEqual((True, None), tile_cache.get('u0j0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
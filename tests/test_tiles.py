@@ -0,0 +1,133 @@
+import itertools
+import os
+import random
+import unittest
+
+
+class TestTiles(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls) -> None:
+
+        os.environ.setdefault('MONGODB_MAX_PAGE_SIZE', '2')
+
+    def testGetCoveringTilesWhenBoxIsWithinTile(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_tiles, get_tile_box
+
+        tile_box = get_tile_box(geohash='u0j2w')
+        box = Box(
+            min_latitude=tile_box.min_latitude + 0.001,
+            min_longitude=tile_box.min_longitude + 0.001,
+            max_latitude=tile_box.max_latitude - 0.001,
+            max_longitude=tile_box.max_longitude - 0.001
+        )
+
+        self.assertEqual(['u0j2w'], get_covering_tiles(box=box, precision=5))
+        self.assertTrue(box.within(tile_box))
+
+    def testGetCoveringTilesWhenBoxSpansSeveralTiles(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_tiles, get_tile_box
+
+        box = Box(min_latitude=45.0, min_longitude=7.3, max_latitude=45.3, max_longitude=7.9)
+        tiles = get_covering_tiles(box=box, precision=4)
+        tile_boxes = [get_tile_box(geohash=tile) for tile in tiles]
+
+        self.assertEqual(len(tiles), len(set(tiles)))
+        self.assertTrue(all(tile_box.intersection(box) is not None for tile_box in tile_boxes))
+        for latitude in (45.0, 45.15, 45.3):
+            for longitude in (7.3, 7.6, 7.9):
+                self.assertTrue(any(
+                    tile_box.contains(latitude=latitude, longitude=longitude) for tile_box in tile_boxes
+                ))
+
+    def testGetCoveringPrecisionWhenBoxIsPanned(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_precision, get_covering_tiles
+
+        randomizer = random.Random(42)
+        for width in (0.03, 0.2):
+            height = width * 9 / 16
+            latitude = 45.0 + randomizer.random()
+            longitude = 7.0 + randomizer.random()
+            precisions = set()
+            for pan in range(200):
+                box = Box(
+                    min_latitude=latitude + pan * height * 0.1,
+                    min_longitude=longitude + pan * width * 0.1,
+                    max_latitude=latitude + pan * height * 0.1 + height,
+                    max_longitude=longitude + pan * width * 0.1 + width
+                )
+                precision = get_covering_precision(box=box, max_tiles=16)
+                precisions.add(precision)
+
+                self.assertLessEqual(len(get_covering_tiles(box=box, precision=precision)), 16)
+
+            self.assertEqual(1, len(precisions))
+
+    def testGetCoveringPrecisionWhenBoxIsLargerThanTiles(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_precision
+
+        self.assertEqual(0, get_covering_precision(
+            box=Box(min_latitude=-80.0, min_longitude=-170.0, max_latitude=80.0, max_longitude=170.0), max_tiles=4
+        ))
+
+    def testGetCoveringBlocksWhenBoxIsWide(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_blocks, get_splitting_precision
+
+        for box in (
+                Box(min_latitude=36.6, min_longitude=6.6, max_latitude=47.1, max_longitude=18.5),
+                Box(min_latitude=0.0, min_longitude=0.0, max_latitude=40.0, max_longitude=40.0),
+                Box(min_latitude=44.0567, min_longitude=5.3846, max_latitude=46.1102, max_longitude=9.9208)
+        ):
+            precision = get_splitting_precision(box=box, min_tiles=16)
+            blocks = get_covering_blocks(box=box, precision=precision, max_blocks=16)
+
+            self.assertEqual(16, len(blocks))
+            self.assertTrue(all(block.within(box) for block in blocks))
+            self.assertAlmostEqual(
+                (box.max_latitude - box.min_latitude) * (box.max_longitude - box.min_longitude),
+                sum((block.max_latitude - block.min_latitude) * (block.max_longitude - block.min_longitude)
+                    for block in blocks)
+            )
+            for block, other in itertools.combinations(blocks, 2):
+                overlap = block.intersection(other)
+                self.assertTrue(overlap is None or overlap.min_latitude == overlap.max_latitude
+                                or overlap.min_longitude == overlap.max_longitude)
+
+    def testGetCoveringBlocksWhenFewTilesCoverBox(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_blocks
+
+        box = Box(min_latitude=45.0, min_longitude=7.3, max_latitude=45.3, max_longitude=7.9)
+
+        self.assertEqual([box], get_covering_blocks(box=box, precision=1, max_blocks=16))
+
+    def testGroupTilesWhenMissingTilesFormStrips(self):
+
+        from fetch_properties.core.schema.tiles import Box, get_covering_tiles, group_tiles
+
+        box = Box(min_latitude=45.0, min_longitude=7.6, max_latitude=45.05, max_longitude=7.7)
+        tiles = get_covering_tiles(box=box, precision=6)
+        first_row = tiles[:10]
+        last_column = tiles[19::10]
+
+        self.assertEqual(1, len(group_tiles(tiles=tiles)))
+        self.assertEqual([first_row], [block for _, block in group_tiles(tiles=first_row)])
+        self.assertEqual(2, len(group_tiles(tiles=first_row + last_column)))
+
+    def testIntersectionWhenBoxesAreDisjoint(self):
+
+        from fetch_properties.core.schema.tiles import Box
+
+        box = Box(min_latitude=45.0, min_longitude=7.0, max_latitude=45.1, max_longitude=7.1)
+        other = Box(min_latitude=45.2, min_longitude=7.0, max_latitude=45.3, max_longitude=7.1)
+
+        self.assertIsNone(box.intersection(other))
+
+
+if __name__ == '__main__':
+    unittest.main()